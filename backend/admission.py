@@ -0,0 +1,80 @@
+from typing import TYPE_CHECKING, Hashable
+
+from constants import (ADMISSION_ESCALATION, ADMISSION_MAX_Z, ADMISSION_MIN_Z, ADMISSION_TARGET_LATENCY,
+                       ADMISSION_Z_PER_SECOND, Z_CUTOFF, debounce)
+from detection_queue import DetectionQueue
+
+if TYPE_CHECKING:
+    from decision_service import DecisionService
+
+
+class AdmissionController:
+    """
+    Works out the z-score a person needs to be sent to the decision layer from
+    how long a new suspect would wait for its verdict: the queue ahead of it
+    spread over the workers, times the recent LLM latency. Past the target
+    latency the threshold rises, shedding the least suspicious first, and with
+    an idle decision layer it drops below Z_CUTOFF.
+    """
+
+    def __init__(
+        self,
+        queue: DetectionQueue,
+        decisions: "DecisionService",
+        base: float = Z_CUTOFF,
+        target_latency: float = ADMISSION_TARGET_LATENCY,
+        z_per_second: float = ADMISSION_Z_PER_SECOND,
+        min_z: float = ADMISSION_MIN_Z,
+        max_z: float = ADMISSION_MAX_Z,
+    ):
+        self.queue = queue
+        self.decisions = decisions
+        self.base = base
+        self.target_latency = target_latency
+        self.z_per_second = z_per_second
+        self.min_z = min_z
+        self.max_z = max_z
+
+    def expected_latency(self) -> float:
+        waiting = len(self.queue) + self.decisions.in_flight
+        return self.decisions.latency * (1 + waiting / max(1, self.decisions.workers))
+
+    def threshold(self) -> float:
+        threshold = self.base + self.z_per_second * (self.expected_latency() - self.target_latency)
+        return min(self.max_z, max(self.min_z, threshold))
+
+    def stats(self) -> dict:
+        return {
+            "z_cutoff": self.threshold(),
+            "expected_latency": self.expected_latency(),
+        }
+
+
+class TrackDebounce:
+    """
+    Keeps a person who was just reported from being reported again for a
+    while, without silencing everyone else in the scene. A track whose
+    z-score climbs well past the one it was reported with gets through anyway.
+    """
+
+    def __init__(self, interval: float = debounce, escalation: float = ADMISSION_ESCALATION):
+        self.interval = interval
+        self.escalation = escalation
+        self._reported: dict[Hashable, tuple[float, float]] = {}  # track id -> (time, z-score)
+
+        self.suppressed = 0
+
+    def ready(self, track_id: Hashable, z: float, now: float) -> bool:
+        reported = self._reported.get(track_id)
+        if reported is None or now - reported[0] > self.interval or z >= reported[1] + self.escalation:
+            return True
+        self.suppressed += 1
+        return False
+
+    def mark(self, track_id: Hashable, z: float, now: float):
+        # Forget tracks whose window has passed, so ids don't pile up
+        self._reported = {key: value for key, value in self._reported.items() if now - value[0] <= self.interval}
+        self._reported[track_id] = (now, z)
+
+    def stats(self) -> dict:
+        return {"debounced_tracks": len(self._reported), "suppressed": self.suppressed}
@@ -0,0 +1,40 @@
+import queue
+import sqlite3
+import threading
+from typing import Any, Callable
+
+
+class BatchedWriter:
+    """
+    Applies queued writes to SQLite from a background thread, so callers
+    never wait on disk. Whatever has queued up by the time the thread gets
+    to it goes into one transaction.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], write: Callable[[sqlite3.Connection, list], None], name: str):
+        self.connect = connect
+        self.write = write
+        self.name = name
+
+        self._queue: queue.Queue[Any] = queue.Queue()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def put(self, item: Any):
+        self._queue.put(item)
+
+    def _run(self):
+        connection = self.connect()
+        while True:
+            items = [self._queue.get()]
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            try:
+                with connection:
+                    self.write(connection, items)
+            except sqlite3.Error as e:
+                print(f"Error saving {self.name}: {e}")
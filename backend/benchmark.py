@@ -0,0 +1,243 @@
+"""
+Offline replay benchmark. Feeds recorded video through the real detection and
+decision path (InferenceScheduler with tracking and the quality gate -> to_queues -> call_decision_layer),
+each video on its own thread like a camera, with a local mock OpenAI-compatible
+server standing in for the LLM, and writes throughput plus per-stage latency
+percentiles to JSON for comparing commits.
+
+    python benchmark.py fixtures/lobby.mp4 fixtures/corridor.mp4 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+import instructor
+import numpy as np
+from openai import AsyncOpenAI
+
+import common
+import decision_layer
+import detection_layer
+import inference_scheduler
+from admission import TrackDebounce
+from decision_layer import DecisionAnswer, EscalationLevel, call_decision_layer
+from detection_layer import draw_z_scores, get_backend, to_queues
+from detection_queue import annotation_queue
+from frame_sources import open_source
+from inference_backend import synchronize
+from inference_scheduler import InferenceScheduler
+from leaderboard_manager import LeaderboardManager
+from threat_stats import ThreatStats
+from tracker import IoUTracker
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    def record(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds * 1000)
+
+    def measure(self, stage: str):
+        return _Measure(self, stage)
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            with self.measure(stage):
+                return function(*args, **kwargs)
+        return timed
+
+    def summary(self) -> dict:
+        return {
+            stage: {
+                "count": len(values),
+                "mean_ms": float(np.mean(values)),
+                "p50_ms": float(np.percentile(values, 50)),
+                "p95_ms": float(np.percentile(values, 95)),
+                "p99_ms": float(np.percentile(values, 99)),
+            }
+            for stage, values in self.samples.items() if values
+        }
+
+
+class _Measure:
+    def __init__(self, timer: StageTimer, stage: str):
+        self.timer = timer
+        self.stage = stage
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+
+    def __exit__(self, *exc):
+        synchronize(get_backend().device)
+        self.timer.record(self.stage, time.perf_counter() - self.started_at)
+
+
+def start_mock_llm(latency: float) -> str:
+    """Serve canned chat completions on localhost and return the base URL."""
+    answer = DecisionAnswer(
+        higher_level_reasoning="Benchmark run.",
+        escalation_level=EscalationLevel.LOG,
+        escalation_reason="Mock answer.",
+    ).model_dump_json()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            body = json.dumps({
+                "id": "mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "mock",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1"
+
+
+async def consume_verdicts(timer: StageTimer, verdicts: list[DecisionAnswer], done: threading.Event):
+    while not (done.is_set() and len(annotation_queue) == 0):
+        try:
+            suspect = await asyncio.wait_for(annotation_queue.get(), timeout=0.1)
+        except asyncio.TimeoutError:
+            continue
+        timer.record("queue_wait", time.time() - suspect.created_at)
+
+        started_at = time.perf_counter()
+        decision = await call_decision_layer(suspect.image_base64)
+        timer.record("llm", time.perf_counter() - started_at)
+        if decision is not None:
+            verdicts.append(decision)
+
+
+def instrument(timer: StageTimer, scheduler: InferenceScheduler):
+    # Timed where the scheduler and to_queues call them, so batching, embedding reuse
+    # and encoding each crop once all show up as they do in production
+    for stage, name in (("yolo", "detect_people_batch"), ("preprocess", "preprocess_people"), ("clip", "embed_people"), ("score", "score_people")):
+        setattr(inference_scheduler, name, timer.wrap(stage, getattr(inference_scheduler, name)))
+    scheduler.quality_gate.check = timer.wrap("quality", scheduler.quality_gate.check)
+    common.encode_jpeg = timer.wrap("encode", common.encode_jpeg)
+
+
+def replay(path: str, scheduler: InferenceScheduler, timer: StageTimer, stats: ThreatStats, leaderboard: LeaderboardManager, max_frames: int) -> int:
+    source = open_source({"type": "video", "path": path, "realtime": False})
+    if not source.isOpened():
+        raise RuntimeError(f"Could not open {path}")
+
+    frames = 0
+    tracker = IoUTracker()
+    tracker.update = timer.wrap("tracking", tracker.update)
+    debouncer = TrackDebounce()
+    try:
+        while max_frames <= 0 or frames < max_frames:
+            with timer.measure("capture"):
+                success, frame = source.read()
+            if not success:
+                break
+            frames += 1
+
+            # Batched with the other videos, as frames from several cameras are
+            with timer.measure("inference"):
+                people, results, z_scores, similarities, track_ids, features, usable, quality = scheduler.infer(frame, tracker, stats)
+            with timer.measure("to_queues"):
+                to_queues(people, z_scores, similarities, track_ids, debouncer, leaderboard, features, usable=usable, quality=quality)
+            with timer.measure("annotate"):
+                draw_z_scores(frame, results, z_scores, track_ids)
+            common.encode_jpeg(frame)
+    finally:
+        source.release()
+    return frames
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded video through the pipeline and time each stage.")
+    parser.add_argument("videos", nargs="+", help="Video fixtures to replay")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--max-frames", type=int, default=0, help="Per video, 0 replays everything")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds the mock LLM takes to answer")
+    parser.add_argument("--z-cutoff", type=float, default=None, help="Override Z_CUTOFF to force more verdicts")
+    args = parser.parse_args()
+
+    decision_layer.USE_GOOGLE = True
+    decision_layer.client = instructor.from_openai(
+        AsyncOpenAI(base_url=start_mock_llm(args.llm_latency), api_key="benchmark"),
+        mode=instructor.Mode.JSON,
+    )
+    if args.z_cutoff is not None:
+        detection_layer.Z_CUTOFF = args.z_cutoff
+
+    get_backend()
+    timer = StageTimer()
+    verdicts: list[DecisionAnswer] = []
+    done = threading.Event()
+    consumer = threading.Thread(target=lambda: asyncio.run(consume_verdicts(timer, verdicts, done)), daemon=True)
+    consumer.start()
+
+    scheduler = InferenceScheduler()
+    instrument(timer, scheduler)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        leaderboard = LeaderboardManager(db_path=os.path.join(scratch, "leaderboard.db"))
+
+        def replay_video(index: int, path: str) -> int:
+            stats = ThreatStats(f"benchmark-{index}", path=os.path.join(scratch, f"threat_stats_{index}.json"))
+            return replay(path, scheduler, timer, stats, leaderboard, args.max_frames)
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(args.videos)) as pool:
+            frames = sum(pool.map(replay_video, range(len(args.videos)), args.videos))
+        frame_seconds = time.perf_counter() - started_at
+
+        done.set()
+        consumer.join()
+        total_seconds = time.perf_counter() - started_at
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "videos": args.videos,
+        "backend": get_backend().name,
+        "device": get_backend().device,
+        "llm_latency": args.llm_latency,
+        "frames": frames,
+        "verdicts": len(verdicts),
+        "fps": frames / frame_seconds if frame_seconds > 0 else 0.0,
+        "verdicts_per_second": len(verdicts) / total_seconds if total_seconds > 0 else 0.0,
+        "avg_batch_size": scheduler.stats()["avg_batch_size"],
+        "stages": timer.summary(),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
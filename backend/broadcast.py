@@ -0,0 +1,35 @@
+import asyncio
+from typing import AsyncIterator, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class Broadcaster(Generic[T]):
+    """
+    Fans every published message out to all current subscribers. Each
+    subscriber has a small buffer; if it falls behind, its oldest messages
+    are dropped rather than holding up the others.
+    """
+
+    def __init__(self, buffer_size: int = 16):
+        self.buffer_size = buffer_size
+        self._subscribers: set[asyncio.Queue[T]] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, message: T):
+        for subscriber in self._subscribers:
+            if subscriber.full():
+                subscriber.get_nowait()
+            subscriber.put_nowait(message)
+
+    async def subscribe(self) -> AsyncIterator[T]:
+        subscriber: asyncio.Queue[T] = asyncio.Queue(maxsize=self.buffer_size)
+        self._subscribers.add(subscriber)
+        try:
+            while True:
+                yield await subscriber.get()
+        finally:
+            self._subscribers.discard(subscriber)
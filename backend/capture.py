@@ -0,0 +1,108 @@
+import threading
+import time
+from typing import Callable
+
+import cv2
+import numpy as np
+
+from constants import MAX_FRAME_AGE
+
+
+class FrameGrabber:
+    """
+    Reads a capture device in its own thread and keeps only the newest frame,
+    so inference always works on the freshest image and the driver buffer never
+    fills up with stale frames while inference is busy.
+    """
+
+    def __init__(self, open_camera: Callable[[], cv2.VideoCapture], max_frame_age: float = MAX_FRAME_AGE):
+        self.open_camera = open_camera
+        self.max_frame_age = max_frame_age
+
+        self.camera: cv2.VideoCapture | None = None
+        self._cond = threading.Condition()
+        self._frame: np.ndarray | None = None
+        self._captured_at = 0.0
+        self._running = False
+        self._thread: threading.Thread | None = None
+
+        self.captured = 0
+        self.consumed = 0
+        self.dropped = 0  # Overwritten before anyone read them
+        self.stale = 0  # Older than max_frame_age when handed to inference
+        self.latency = 0.0  # Glass to verdict for the last processed frame
+        self.capture_interval = 0.0  # EMA of seconds between camera frames
+
+    def start(self):
+        self.camera = self.open_camera()
+        if not self.camera.isOpened():
+            raise RuntimeError("Could not open frame source.")
+
+        # Ask the driver not to queue frames on its side either
+        self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        # Intervals are measured within one run, not across a restart
+        self._frame = None
+        self._captured_at = 0.0
+        self.captured = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if self.camera is not None:
+            self.camera.release()
+
+    def _run(self):
+        assert self.camera is not None
+        while self._running:
+            success, frame = self.camera.read()
+            captured_at = time.time()
+
+            with self._cond:
+                if not success:
+                    self._running = False
+                    self._cond.notify_all()
+                    break
+
+                if self._frame is not None:
+                    self.dropped += 1
+                if self.captured > 0:
+                    interval = captured_at - self._captured_at
+                    self.capture_interval = interval if self.captured == 1 else 0.9 * self.capture_interval + 0.1 * interval
+                self._frame = frame
+                self._captured_at = captured_at
+                self.captured += 1
+                self._cond.notify_all()
+
+    def read(self) -> tuple[np.ndarray, float] | None:
+        """Block until a frame newer than the last one read is available."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._frame is not None or not self._running)
+            if self._frame is None:
+                return None
+
+            frame, captured_at = self._frame, self._captured_at
+            self._frame = None
+            self.consumed += 1
+
+        if time.time() - captured_at > self.max_frame_age:
+            self.stale += 1
+        return frame, captured_at
+
+    def mark_done(self, captured_at: float):
+        self.latency = time.time() - captured_at
+
+    def stats(self) -> dict:
+        return {
+            "captured": self.captured,
+            "consumed": self.consumed,
+            "dropped": self.dropped,
+            "stale": self.stale,
+            "latency": self.latency,
+        }
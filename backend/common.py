@@ -1,12 +1,17 @@
 import base64
+import time
 from typing import List
 import cv2
 import numpy as np
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from constants import JPEG_QUALITY
+from metrics import encode_seconds
 
 class Score(BaseModel):
     id: str
-    image: str
+    image: str  # URL of the full image
+    thumbnail: str  # URL of a small preview
     name: str
     score: float
 
@@ -16,13 +21,58 @@ class Leaderboard(BaseModel):
 
 
 class Detection(BaseModel):
-    image: str
+    image: bytes  # Raw JPEG
+    score: float
+    created_at: float = Field(default_factory=time.time)
+    embedding: list[float] | None = None  # Normalised CLIP image embedding
+    camera_id: str | None = None
+    quality: list[float] | None = None  # Crop height, sharpness and brightness, see QualityGate
+
+
+    @property
+    def image_base64(self) -> str:
+        return base64.b64encode(self.image).decode("utf-8")
+
+
+class Verdict(BaseModel):
+    id: int
+    camera_id: str | None
     score: float
+    created_at: float  # When the suspect was detected
+    decided_at: float
+    higher_level_reasoning: str
+    escalation_level: str
+    escalation_reason: str
+    image: str  # URL of the crop
+    clip: str | None = None  # URL of the video around the detection, for escalations
+
+
+class VerdictPage(BaseModel):
+    verdicts: List[Verdict]  # Newest first
+    next_cursor: int | None  # Pass as cursor for the next, older page
+
+
+def encode_jpeg(frame: np.ndarray, quality: int = JPEG_QUALITY) -> bytes:
+    with encode_seconds.time():
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
 
 
-annotation_queue: list[Detection] = list()
+class EncodedImage:
+    """
+    An image that is JPEG-encoded at most once, on first use, and whose bytes
+    are then shared by every consumer (queue, leaderboard, clients).
+    """
 
+    def __init__(self, image: np.ndarray | None = None, quality: int = JPEG_QUALITY, jpeg: bytes | None = None):
+        self._image = image
+        self.quality = quality
+        self._jpeg = jpeg
 
-def encode(frame: np.ndarray) -> str:
-    _, buffer = cv2.imencode('.jpg', frame)
-    return base64.b64encode(buffer).decode("utf-8") # type: ignore
+    @property
+    def jpeg(self) -> bytes:
+        if self._jpeg is None:
+            assert self._image is not None
+            self._jpeg = encode_jpeg(self._image, self.quality)
+            self._image = None  # Let go of the frame the crop points into
+        return self._jpeg
@@ -1,4 +1,110 @@
 Z_CUTOFF = 5.0
 SIM_MEAN = 0.155
 SIM_VAR = 0.001
-debounce = 2  # seconds
\ No newline at end of file
+debounce = 2  # seconds a person is not reported again, per track
+MAX_FRAME_AGE = 0.5  # seconds, older frames are counted as stale
+
+# Camera id -> frame source settings, see frame_sources.open_source
+CAMERAS = {
+    "default": {"type": "webcam", "index": 0},
+}
+
+# Frames from all cameras are batched into one YOLO and one CLIP call
+INFERENCE_MAX_BATCH = 8
+INFERENCE_MAX_WAIT = 0.01  # seconds to wait for more frames before running a batch
+
+# Tracking and per-track CLIP embedding cache
+TRACK_IOU = 0.3  # minimum overlap to continue a track
+TRACK_MAX_MISSES = 15  # frames a track may go unseen before it is dropped
+TRACK_REEMBED_IOU = 0.7  # re-run CLIP when the box moved more than this
+TRACK_REFRESH = 5.0  # seconds before a cached embedding is refreshed anyway
+
+# Detections waiting for the decision layer
+ANNOTATION_QUEUE_SIZE = 32
+ANNOTATION_TTL = 30.0  # seconds before an unprocessed detection is discarded
+
+# Decision layer worker pool
+DECISION_WORKERS = 4
+DECISION_RATE = 2.0  # LLM requests per second
+DECISION_BURST = 4
+DECISION_RETRIES = 3
+DECISION_TIMEOUT = 30.0  # seconds per request
+DECISION_BACKOFF = 0.5  # seconds, doubled on each retry
+DECISION_BATCH_SIZE = 4  # crops per external request, 1 sends every crop on its own
+DECISION_BATCH_WAIT = 0.25  # seconds to let a burst gather before sending a batch
+DECISION_DEADLINE = 15.0  # seconds since detection, older suspects are dropped instead of sent
+DECISION_LATENCY_PRIOR = 5.0  # seconds per call assumed until calls have been timed, admission starts at Z_CUTOFF
+
+# Admission ahead of the decision layer, the z-score a person needs follows the backlog
+ADMISSION_TARGET_LATENCY = 5.0  # seconds from detection to verdict the threshold steers towards
+ADMISSION_Z_PER_SECOND = 1.0  # threshold change per second of expected latency off target
+ADMISSION_MIN_Z = 4.0
+ADMISSION_MAX_Z = 12.0
+ADMISSION_ESCALATION = 2.0  # z-score rise that reports a debounced track again
+
+# Reuse verdicts for crops that look like one that was already decided
+VERDICT_CACHE_SIMILARITY = 0.92  # cosine similarity of CLIP embeddings
+VERDICT_CACHE_TTL = 300.0  # seconds
+VERDICT_CACHE_SIZE = 256
+
+# Leaderboards
+LEADERBOARD_SIZE = 5
+LEADERBOARD_DB = "./leaderboard.db"
+THUMBNAIL_SIZE = 240  # pixels, longest side
+
+JPEG_QUALITY = 80
+
+# Inference backend
+INFERENCE_BACKEND = "auto"  # "torch", "onnx", "openvino", or "auto" (torch on a GPU, onnx on CPU)
+INFERENCE_DEVICE = "auto"  # "cuda", "mps", "cpu" or "auto"
+INFERENCE_INT8 = False  # Quantize exported models to INT8
+INFERENCE_THREADS = 0  # CPU threads for exported models, 0 lets the runtime decide
+INFERENCE_CALIBRATION_DIR = "./calibration"  # JPEG frames from the cameras to calibrate INT8 YOLO on
+INFERENCE_CALIBRATION_FRAMES = 64
+MODEL_CACHE_DIR = "./model_cache"  # Exported models are kept here between runs
+YOLO_WEIGHTS = "yolo11n.pt"
+CLIP_MODEL = "ViT-B/32"
+
+# Per-camera similarity baseline used for z-scores
+SIM_ALPHA = 0.0001  # Exponential moving average factor
+THREAT_STATS_FILE = "./threat_stats.json"
+THREAT_STATS_SAVE_INTERVAL = 60.0  # seconds
+
+# Motion gating ahead of inference
+MOTION_WIDTH = 160  # pixels, frames are downscaled to this width for differencing
+MOTION_PIXEL_THRESHOLD = 25  # grey levels a pixel must change by to count as motion
+MOTION_MIN_AREA = 0.002  # fraction of changed pixels that counts as motion
+MOTION_IDLE_INTERVAL = 2.0  # seconds, static scenes are still re-checked this often
+INFERENCE_THROTTLE = 1.5  # spacing between inferences, in inference durations, when a stream falls behind
+
+# Detection process, annotated frames come back through shared memory
+FRAME_RING_SLOTS = 4  # per camera, readers only fall behind when the writer laps the ring
+FRAME_RING_SLOT_SIZE = 4 * 1024 * 1024  # bytes, larger encoded frames are dropped
+DETECTION_STATS_INTERVAL = 1.0  # seconds between stats snapshots from the detection process
+DETECTION_STOP_TIMEOUT = 10.0  # seconds to wait for the detection process to save and exit
+
+# Verdict history
+VERDICT_DB = "./verdicts.db"
+VERDICT_PAGE_SIZE = 50
+VERDICT_PAGE_MAX = 500
+VERDICT_RETENTION = 30 * 24 * 3600.0  # seconds verdicts and their crops are kept
+
+# Crop quality gate ahead of CLIP and the decision layer
+QUALITY_MIN_HEIGHT = 48  # pixels
+QUALITY_MIN_SHARPNESS = 20.0  # variance of the Laplacian, lower is blurrier
+QUALITY_MIN_BRIGHTNESS = 35.0  # mean grey level
+QUALITY_MAX_BRIGHTNESS = 225.0
+QUALITY_EDGE_MARGIN = 2  # pixels, boxes this close to the border may be cut off by it
+QUALITY_EDGE_ASPECT = (1.0, 4.0)  # height / width a person touching the border must have to count as whole
+QUALITY_LEARNING_RATE = 0.1  # how far one verdict moves a learned threshold
+QUALITY_LEARNING_MARGIN = 1.5  # crops within this factor of a threshold teach it
+QUALITY_MAX_RAISE = 3.0  # learned thresholds stay below this many times the configured ones
+
+# Clips around escalations, cut from a per-stream buffer of encoded frames
+CLIP_DIR = "./clips"
+CLIP_PRE_SECONDS = 10.0  # before the detection
+CLIP_POST_SECONDS = 10.0  # after the detection
+# Whichever cap is hit first sets how far back a clip can start, about a minute at 30 fps and typical JPEG sizes.
+# A verdict that comes later than that, after retries and a batch fallback, gets no clip
+CLIP_BUFFER_BYTES = 96 * 1024 * 1024  # per stream, the oldest frames go first once it is full
+CLIP_BUFFER_FRAMES = 4096  # per stream
@@ -1,9 +1,11 @@
 import base64
+import os
 from enum import Enum
-from pydantic import BaseModel, Field
-import tempfile
+from pydantic import BaseModel, Field, ValidationError
 
+import httpx
 import instructor
+from instructor.exceptions import InstructorRetryException
 from ollama import AsyncClient
 from openai import AsyncOpenAI
 
@@ -14,8 +16,12 @@ if USE_GOOGLE:
     VISION_MODEL = "gemini-1.5-flash"
     DECISION_MODEL = "gemini-1.5-flash"
     
-    with open("./.env", "r") as f:
-        API_KEY = f.read().strip()
+    try:
+        with open("./.env", "r") as f:
+            API_KEY = f.read().strip()
+    except FileNotFoundError:
+        # Placeholder so the module still imports, requests will be rejected without a real key
+        API_KEY = os.environ.get("GEMINI_API_KEY", "missing")
 else:
     VISION_MODEL = "llama3.2-vision:11b"
     DECISION_MODEL = "gemma2:9b"
@@ -36,6 +42,9 @@ vision_client = AsyncOpenAI(
     api_key=API_KEY
 )
 
+# One pooled client, so describing a crop doesn't pay for a new connection
+ollama_client = AsyncClient(limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=60.0))
+
 class EscalationLevel(Enum):
     NOT_READABLE = 'Not Readable'
     FALSE_POSITIVE = 'False Positive'
@@ -49,6 +58,14 @@ class DecisionAnswer(BaseModel):
     escalation_reason: str = Field(description="The reason for escalation. You should always write something here. Up to 18 words.")
 
 
+class CropDecision(DecisionAnswer):
+    crop_index: int = Field(description="Index of the image this decision is about, as given in the request")
+
+
+class BatchDecision(BaseModel):
+    decisions: list[CropDecision] = Field(description="Exactly one decision per image")
+
+
 describer_prompt = """
 You are an observational analyst designed to assist with image interpretation for safety and situational awareness systems. Your task is to analyze images provided by a basic image detection system.
 Carefully describe the details of the person or people in the image, focusing on observable features such as facial expressions, body posture, and visible objects. Highlight any elements that might indicate emotions, actions, or context but avoid making assumptions beyond the visible details.
@@ -83,8 +100,21 @@ If the image is not readable due to poor lighting or blur, or if the image gener
 
 """
 
+batch_prompt = external_prompt + """
+You will be given several images at once, each one introduced by its index. Assess every image on its own, as if it was the only one you were shown, and give exactly one decision per image, tagged with that image's index.
+"""
+
 
 async def call_decision_layer(image_buffer: str) -> DecisionAnswer | None:
+    try:
+        return await request_decision(image_buffer)
+    except Exception as e:
+        print(f"Error calling decision layer: {e}")
+        return None
+
+
+async def request_decision(image_buffer: str) -> DecisionAnswer | None:
+    # Raises on provider errors so callers can decide whether to retry
     if USE_GOOGLE:
         return await call_external_service(image_buffer)
     else:
@@ -99,72 +129,108 @@ async def call_dummy_service(image_path: str) -> str | None:
         )
 
 
-async def call_external_service(image_buffer: str) -> str | None:
+async def call_external_service(image_buffer: str) -> DecisionAnswer | None:
+    return await client.chat.completions.create(
+        model=DECISION_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": external_prompt,
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                       "type": "text",
+                        "text": "What is in this image?",
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url":  f"data:image/jpeg;base64,{image_buffer}"
+                        },
+                    },
+                ],
+            }
+        ],
+        response_model=DecisionAnswer,
+    )
+
+
+async def request_batch_decision(image_buffers: list[str]) -> list[DecisionAnswer | None]:
+    """
+    One external request for several crops, answered per crop, with None in
+    place of any crop it skipped. An answer that could not be parsed skips
+    every crop, transport errors are raised.
+    """
+    content = []
+    for index, image_buffer in enumerate(image_buffers):
+        content.append({"type": "text", "text": f"Image {index}:"})
+        content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_buffer}"}})
+
     try:
-        return await client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=DECISION_MODEL,
             messages=[
                 {
                     "role": "system",
-                    "content": external_prompt,
+                    "content": batch_prompt,
                 },
                 {
                     "role": "user",
-                    "content": [
-                        {
-                           "type": "text",
-                            "text": "What is in this image?",
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url":  f"data:image/jpeg;base64,{image_buffer}"
-                            },
-                        },
-                    ],
+                    "content": content,
                 }
             ],
-            response_model=DecisionAnswer,
+            response_model=BatchDecision,
         )
-    except Exception as e:
-        print(f"Error calling decision layer: {e}")
-        return None
+    except InstructorRetryException as e:
+        # Instructor wraps transport errors too, those came back without a completion
+        if getattr(e, "last_completion", None) is None:
+            raise
+        print(f"Could not parse batched decision: {e}")
+        return [None] * len(image_buffers)
+    except ValidationError as e:
+        print(f"Could not parse batched decision: {e}")
+        return [None] * len(image_buffers)
+
+    answers: list[DecisionAnswer | None] = [None] * len(image_buffers)
+    for decision in response.decisions:
+        if 0 <= decision.crop_index < len(answers) and answers[decision.crop_index] is None:
+            answers[decision.crop_index] = DecisionAnswer(**decision.model_dump(exclude={"crop_index"}))
+    return answers
 
 
 async def call_internal_service(image_buffer: str) -> DecisionAnswer | None:
-    image_description = await get_image_description(image_buffer)
-    print('-------------\n' + image_description + '\n-------------')
-    try:
-        return await client.chat.completions.create(
-            model=DECISION_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": decision_prompt,
-                },
-                {
-                    "role": "user",
-                    "content": image_description
-                }
-            ],
-            response_model=DecisionAnswer,
-        )
-    except Exception as e:
-        print(f"Error calling decision layer: {e}")
-        return None
+    image_description = await get_image_description(base64.b64decode(image_buffer))
+    return await decide_from_description(image_description)
 
 
-async def get_image_description(image_buffer: str) -> str:
-    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=True) as temp_file:
-        temp_file.write(base64.b64decode(image_buffer))
-        temp_file.flush()
-        
-        response = await AsyncClient().chat(
-            model=VISION_MODEL,
-            messages=[{
-                'role': 'user',
-                'content': describer_prompt,
-                'images': [temp_file.name] #[f"data:image/jpeg;base64,{base64_image}"]
-            }]
-        )
+async def decide_from_description(image_description: str) -> DecisionAnswer | None:
+    print('-------------\n' + image_description + '\n-------------')
+    return await client.chat.completions.create(
+        model=DECISION_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": decision_prompt,
+            },
+            {
+                "role": "user",
+                "content": image_description
+            }
+        ],
+        response_model=DecisionAnswer,
+    )
+
+
+async def get_image_description(image: bytes) -> str:
+    # Raw JPEG bytes go straight into the request, no temp file
+    response = await ollama_client.chat(
+        model=VISION_MODEL,
+        messages=[{
+            'role': 'user',
+            'content': describer_prompt,
+            'images': [image]
+        }]
+    )
     return response.message.content
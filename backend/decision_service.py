@@ -0,0 +1,247 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable
+
+from common import Detection
+from constants import (DECISION_BACKOFF, DECISION_BATCH_SIZE, DECISION_BATCH_WAIT, DECISION_BURST, DECISION_DEADLINE,
+                       DECISION_LATENCY_PRIOR, DECISION_RATE, DECISION_RETRIES, DECISION_TIMEOUT, DECISION_WORKERS)
+import decision_layer
+from decision_layer import (DecisionAnswer, decide_from_description, get_image_description, request_batch_decision,
+                            request_decision)
+from detection_queue import DetectionQueue
+from metrics import llm_errors, llm_seconds, verdicts
+from verdict_cache import VerdictCache
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class DecisionService:
+    """
+    Pool of workers that take suspects off the detection queue and ask the
+    decision layer about them, rate limited and retried with backoff.
+    """
+
+    def __init__(
+        self,
+        queue: DetectionQueue,
+        on_verdict: Callable[[Detection, DecisionAnswer], None],
+        workers: int = DECISION_WORKERS,
+        rate: float = DECISION_RATE,
+        burst: int = DECISION_BURST,
+        retries: int = DECISION_RETRIES,
+        timeout: float = DECISION_TIMEOUT,
+        batch_size: int = DECISION_BATCH_SIZE,
+        batch_wait: float = DECISION_BATCH_WAIT,
+        deadline: float = DECISION_DEADLINE,
+    ):
+        self.queue = queue
+        self.on_verdict = on_verdict
+        self.workers = workers
+        self.retries = retries
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.deadline = deadline
+        self.bucket = TokenBucket(rate, burst)
+        self.cache = VerdictCache()
+        self._tasks: list[asyncio.Task] = []
+        self._described: asyncio.Queue[tuple[Detection, str]] | None = None
+        self._collecting = asyncio.Lock()
+
+        self.in_flight = 0
+        self.verdicts = 0
+        self.retried = 0
+        self.failed = 0  # Gave up after all retries
+        self.empty = 0  # Provider answered but returned no decision
+        self.batches = 0
+        self.batched = 0  # Suspects decided as part of a batch
+        self.batch_fallbacks = 0  # Suspects a batch didn't answer, sent on their own
+        self.expired = 0  # Past the deadline before a worker got to them
+        self.latency = DECISION_LATENCY_PRIOR  # EMA of seconds per LLM call, failed ones count as a full timeout
+
+    def start(self):
+        if decision_layer.USE_GOOGLE:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            return
+
+        # Bounded, so descriptions don't pile up while the decision model is busy
+        self._described = asyncio.Queue(maxsize=self.workers)
+        self._tasks = [asyncio.create_task(self._describe_worker()) for _ in range(self.workers)]
+        self._tasks += [asyncio.create_task(self._decide_worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            batch = [suspect for suspect in await self._collect() if self._fresh(suspect) and not self._publish_cached(suspect)]
+            if len(batch) == 1:
+                self._publish(batch[0], await self._request(batch[0]))
+            elif batch:
+                await self._decide_batch(batch)
+
+    async def _collect(self) -> list[Detection]:
+        # One worker collects at a time, so a burst ends up in one batch rather than one suspect per worker
+        async with self._collecting:
+            batch = [await self.queue.get()]
+            if self.batch_size <= 1:
+                return batch
+
+            # A lone suspect goes out straight away. With others already waiting a burst
+            # is under way, and the rest of it gets until batch_wait to arrive
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                suspect = self.queue.get_nowait()
+                if suspect is None and len(batch) > 1:
+                    suspect = await self.queue.get_within(deadline - time.monotonic())
+                if suspect is None:
+                    break
+                batch.append(suspect)
+            return batch
+
+    async def _decide_batch(self, batch: list[Detection]):
+        answers = await self._call(request_batch_decision, [suspect.image_base64 for suspect in batch])
+        self.batches += 1
+        if answers is None:
+            # Every attempt timed out or errored, already counted as failed
+            return
+
+        missed = []
+        for suspect, decision in zip(batch, answers):
+            if decision is None:
+                missed.append(suspect)
+                continue
+            self.batched += 1
+            self._remember(suspect, decision)
+            self._publish(suspect, decision)
+
+        self.batch_fallbacks += len(missed)
+        decisions = await asyncio.gather(*(self._request(suspect) for suspect in missed))
+        for suspect, decision in zip(missed, decisions):
+            self._publish(suspect, decision)
+
+    async def _describe_worker(self):
+        assert self._described is not None
+        while True:
+            suspect = await self.queue.get()
+            if not self._fresh(suspect) or self._publish_cached(suspect):
+                continue
+
+            description = await self._call(get_image_description, suspect.image)
+            if description is not None:
+                await self._described.put((suspect, description))
+
+    async def _decide_worker(self):
+        assert self._described is not None
+        while True:
+            suspect, description = await self._described.get()
+            decision = await self._call(decide_from_description, description)
+            self._remember(suspect, decision)
+            self._publish(suspect, decision)
+
+    def _publish(self, suspect: Detection, decision: DecisionAnswer | None):
+        if decision is not None:
+            self.verdicts += 1
+            verdicts.labels(escalation_level=decision.escalation_level.value).inc()
+            self.on_verdict(suspect, decision)
+
+    def _fresh(self, suspect: Detection) -> bool:
+        if time.time() - suspect.created_at <= self.deadline:
+            return True
+        self.expired += 1
+        return False
+
+    def _cached(self, suspect: Detection) -> DecisionAnswer | None:
+        if suspect.embedding is None:
+            return None
+        return self.cache.lookup(suspect.embedding, suspect.score)
+
+    def _publish_cached(self, suspect: Detection) -> bool:
+        cached = self._cached(suspect)
+        self._publish(suspect, cached)
+        return cached is not None
+
+    def _remember(self, suspect: Detection, decision: DecisionAnswer | None):
+        if decision is not None and suspect.embedding is not None:
+            self.cache.add(suspect.embedding, decision, suspect.score)
+
+    async def _request(self, suspect: Detection) -> DecisionAnswer | None:
+        decision = await self._call(request_decision, suspect.image_base64)
+        self._remember(suspect, decision)
+        return decision
+
+    async def _call(self, request: Callable[..., Awaitable[Any]], *args) -> Any:
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            self.in_flight += 1
+            started_at = time.monotonic()
+            try:
+                with llm_seconds.time():
+                    result = await asyncio.wait_for(request(*args), self.timeout)
+            except asyncio.TimeoutError:
+                llm_errors.labels(kind="timeout").inc()
+                print(f"Decision layer timed out (attempt {attempt + 1})")
+                self._record_latency(self.timeout)
+            except Exception as e:
+                llm_errors.labels(kind="error").inc()
+                print(f"Error calling decision layer (attempt {attempt + 1}): {e!r}")
+                # However fast it failed, the suspect is no closer to a verdict
+                self._record_latency(self.timeout)
+            else:
+                self._record_latency(time.monotonic() - started_at)
+                if result is None:
+                    self.empty += 1
+                    llm_errors.labels(kind="empty").inc()
+                return result
+            finally:
+                self.in_flight -= 1
+
+            if attempt < self.retries:
+                self.retried += 1
+                # Exponential backoff with full jitter
+                await asyncio.sleep(random.uniform(0, DECISION_BACKOFF * 2 ** attempt))
+
+        self.failed += 1
+        return None
+
+    def _record_latency(self, seconds: float):
+        self.latency = 0.8 * self.latency + 0.2 * seconds
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "verdicts": self.verdicts,
+            "retried": self.retried,
+            "failed": self.failed,
+            "empty": self.empty,
+            "batches": self.batches,
+            "batched": self.batched,
+            "batch_fallbacks": self.batch_fallbacks,
+            "expired": self.expired,
+            "latency": self.latency,
+            "awaiting_decision": self._described.qsize() if self._described is not None else 0,
+            "cache": self.cache.stats(),
+        }
@@ -1,35 +1,65 @@
-import math
+import threading
 import time
-from typing import List, Tuple
+from typing import TYPE_CHECKING, Iterator, List, Tuple
 
-import clip
 import cv2
 import numpy as np
 import torch
 from torch import Tensor
 from torchvision import transforms
-from ultralytics import YOLO
+from torchvision.ops import roi_align
 from ultralytics.engine.results import Results
 
 from leaderboard_manager import LeaderboardManager
-from common import Detection, annotation_queue, encode
-from constants import SIM_MEAN, SIM_VAR, Z_CUTOFF, debounce
-
-device = "mps"
-
-yolo_model = YOLO("yolo11n.pt")
-clip_model, preprocess = clip.load("ViT-B/32", device=device)
+from common import Detection, EncodedImage, encode_jpeg
+from detection_queue import annotation_queue
+from constants import Z_CUTOFF
+from inference_backend import InferenceBackend, load_backend, load_text_features, synchronize
+from metrics import clip_seconds, debounced_detections, preprocess_seconds, yolo_seconds
+
+if TYPE_CHECKING:
+    from admission import TrackDebounce
+    from detection_process import PipelineEvents
+    from detection_queue import DetectionQueue
+    from streams import CameraStream
+    from threat_stats import ThreatStats
+
+# Models are loaded on first use (or by warmup) so importing this module stays cheap
+backend: InferenceBackend | None = None
+text_features: Tensor | None = None
+ready = threading.Event()
+_load_lock = threading.Lock()
 
 # CLIP setup
-clip_text = clip.tokenize(["threat", ""]).to(device)
-text_features = clip_model.encode_text(clip_text)
-text_features /= text_features.norm(dim=-1, keepdim=True)
+clip_prompts = ["threat", ""]
 
 
 # Clip transforms
 normalize = transforms.Normalize((0.48145466, 0.4578275, 0.40821073), (0.26862954, 0.26130258, 0.27577711))
-resize = transforms.Resize(224)
-center_crop = transforms.CenterCrop(224)
+clip_input_size = 224
+
+
+def get_backend() -> InferenceBackend:
+    global backend, text_features
+    if backend is None:
+        with _load_lock:
+            if backend is None:
+                loaded = load_backend()
+                text_features = load_text_features(clip_prompts, loaded.device)
+                backend = loaded
+    return backend
+
+
+def warmup():
+    # Dummy inference so the first real frame doesn't pay for lazy init and kernel selection
+    try:
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        detect_people(frame, classes=[0])
+        embed_people(preprocess_people(frame, torch.tensor([[0.0, 0.0, 320.0, 480.0]])))
+        ready.set()
+    except Exception as e:
+        print(f"Warmup failed: {e}")
+
 
 # Color Guide
 good_col = (0, 150, 0)
@@ -57,70 +87,80 @@ def add_fps_count(frame, prev_time) -> float:
     return current_time
 
 
+def detect_people_batch(imgs: list[np.ndarray], classes=[], conf=0.5) -> list[Tuple[list[np.ndarray], List[Results]]]:
+    # One YOLO call for every frame in the batch
+    with yolo_seconds.time():
+        results: List[Results] = get_backend().predict(imgs, classes=classes, conf=conf)
+    detections = []
+    for img, result in zip(imgs, results):
+        crops = []
+        if result.boxes is not None:
+            for box in result.boxes:
+                # Crop people, views into the frame so nothing is copied here
+                x1, y1 = int(box.xyxy[0][0]), int(box.xyxy[0][1])
+                x2, y2 = int(box.xyxy[0][2]), int(box.xyxy[0][3])
+
+                crops.append(img[y1:y2, x1:x2])
+        detections.append((crops, [result]))
+
+    return detections
+
+
 def detect_people(img, classes=[], conf=0.5, rectangle_thickness=2, text_thickness=1):
-    results: List[Results] = yolo_model.predict(img, classes=classes, conf=conf, device="mps", verbose=False)
-    crops = []
-    for result in results:
-        if result.boxes is None: continue
-        for box in result.boxes:
-            # Crop people
-            x1, y1 = int(box.xyxy[0][0]), int(box.xyxy[0][1])
-            x2, y2 = int(box.xyxy[0][2]), int(box.xyxy[0][3])
+    return detect_people_batch([img], classes=classes, conf=conf)[0]
 
-            crop = img[y1:y2, x1:x2].copy()
-            crops.append(crop)
-    
-    return crops, results
 
+def person_boxes(results: List[Results]) -> Tensor:
+    boxes = [result.boxes.xyxy for result in results if result.boxes is not None]
+    if len(boxes) == 0:
+        return torch.zeros((0, 4))
+    return torch.cat(boxes, dim=0)
 
-def custom_preprocess(img_in: np.ndarray) -> Tensor:
-    #img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img = torch.from_numpy(img_in).float() / 255.0
-    img = img.permute(2, 0, 1)
-    img = normalize(img)
-    img = resize(img)
-    img = center_crop(img)
-    return img
 
+def preprocess_people(img: np.ndarray, boxes: Tensor) -> Tensor:
+    device = get_backend().device
+    if len(boxes) == 0:
+        return torch.zeros((0, 3, clip_input_size, clip_input_size), device=device)
 
-def assess_people(people) -> Tuple[list[float], list[float]]:
-    # Initialize running statistics if not already done
-    if not hasattr(assess_people, 'running_mean'):
-        assess_people.running_mean = SIM_MEAN # type: ignore
-        assess_people.running_var = SIM_VAR # type: ignore
-        assess_people.n = 0 # type: ignore
-        assess_people.alpha = 0.0001 # type: ignore  # Exponential moving average factor
-        assess_people.debounce = 0 # type: ignore
+    with preprocess_seconds.time():
+        # Upload the frame once, BGR -> RGB, 1 x 3 x H x W
+        frame = torch.from_numpy(img).to(device).flip(-1).permute(2, 0, 1).unsqueeze(0).float()
 
-    #assess_people.debounce -= 1
-    #if assess_people.debounce > 0:
-    #    return []
-    #assess_people.debounce = 10
+        # Same geometry as CLIP's Resize + CenterCrop: the centred square of each box's shorter side
+        boxes = boxes.to(device=device, dtype=frame.dtype)
+        x1, y1, x2, y2 = boxes.unbind(dim=1)
+        half_side = torch.minimum(x2 - x1, y2 - y1).clamp(min=1.0) / 2
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        rois = torch.stack([torch.zeros_like(cx), cx - half_side, cy - half_side, cx + half_side, cy + half_side], dim=1)
 
-    people = [custom_preprocess(person) for person in people if person.size != 0]
+        # Crop and resize every person in one op, normalising only the small result
+        people = normalize(roi_align(frame, rois, output_size=clip_input_size, aligned=True) / 255.0)
+        synchronize(device)
+    return people
 
+
+def embed_people(people: Tensor) -> Tensor | None:
     if len(people) == 0:
+        return None
+
+    with torch.no_grad(), clip_seconds.time():
+        image_features = get_backend().encode_image(people).float()
+        image_features /= image_features.norm(dim=-1, keepdim=True)
+        synchronize(image_features.device.type)
+    return image_features
+
+
+def score_people(image_features: Tensor | None, stats: "ThreatStats") -> Tuple[list[float], list[float]]:
+    if image_features is None or len(image_features) == 0:
         return [], []
 
     with torch.no_grad():
-        people = torch.stack(people, dim=0).to(device)
-        image_features = clip_model.encode_image(people)
-        image_features /= image_features.norm(dim=-1, keepdim=True)
-        similarities: Tensor = (100.0 * image_features @ text_features.T).softmax(dim=-1)
-    z_scores = []
-    sim_list = []
-    for similarity in similarities:
-        similarity = similarity[0].item()
-        # Update running mean using exponential moving average (EMA)
-        assess_people.running_mean = (1 - assess_people.alpha) * assess_people.running_mean + assess_people.alpha * similarity # type: ignore
-        assess_people.running_var = (1 - assess_people.alpha) * assess_people.running_var + assess_people.alpha * (similarity - assess_people.running_mean) ** 2 # type: ignore
-        #Calculate z-score once we have enough samples
-
-        std_dev = math.sqrt(assess_people.running_var) if assess_people.running_var > 0 else 1.0 # type: ignore
-        z_score = (similarity - assess_people.running_mean) / std_dev # type: ignore
-        z_scores.append(z_score)
-        sim_list.append(similarity)
-    return z_scores, sim_list
+        similarities: Tensor = (100.0 * image_features @ text_features.T).softmax(dim=-1) # type: ignore
+    return stats.update(similarities[:, 0])
+
+
+def assess_people(img: np.ndarray, results: List[Results], stats: "ThreatStats") -> Tuple[list[float], list[float]]:
+    return score_people(embed_people(preprocess_people(img, person_boxes(results))), stats)
 
 
 def get_color_for_zscore(z_score) -> tuple[int, int, int]:
@@ -150,7 +190,7 @@ def get_color_for_zscore(z_score) -> tuple[int, int, int]:
     return (b, g, r)  # OpenCV uses BGR format
 
 
-def draw_z_scores(frame, object_detection_results, z_scores):
+def draw_z_scores(frame, object_detection_results, z_scores, track_ids=None):
     i = 0
     for result in object_detection_results:
         for box in result.boxes:
@@ -159,53 +199,77 @@ def draw_z_scores(frame, object_detection_results, z_scores):
             
             threat_col = get_color_for_zscore(z_scores[i])
             cv2.rectangle(frame, (x1, y1), (x2, y2), threat_col, 2)
-            cv2.putText(frame, f"Threat Level: {z_scores[i]:.0f}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 1.5, threat_col, 2)
+            label = f"Threat Level: {z_scores[i]:.0f}"
+            if track_ids is not None:
+                label = f"#{track_ids[i]} {label}"
+            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 1.5, threat_col, 2)
             i += 1
 
 
-def to_annotation(image: np.ndarray, z: float, last_debounce_time: float) -> float:
-    if z > Z_CUTOFF:
-        annotation_queue.append(Detection(image=encode(image), score=z))
-        return time.time()
-    else:
-        return last_debounce_time
-
+def to_annotation(image: EncodedImage, z: float, z_cutoff: float, features: Tensor | None = None, queue: "DetectionQueue | PipelineEvents" = annotation_queue, camera_id: str | None = None, quality: list[float] | None = None) -> bool:
+    if z <= z_cutoff:
+        return False
+    embedding = features.float().cpu().tolist() if features is not None else None
+    queue.put(Detection(image=image.jpeg, score=z, embedding=embedding, camera_id=camera_id, quality=quality))
+    return True
 
-def to_queues(people: list[np.ndarray], z_scores: list[float], similarities: list[float], last_debounce_time: float, leaderboard_mgr: LeaderboardManager) -> float:
-    if (time.time() - last_debounce_time) > debounce:
-        for i, z in enumerate(z_scores):
-            last_debounce_time = to_annotation(people[i], z, last_debounce_time)
-            last_debounce_time = leaderboard_mgr.new_score(people[i], similarities[i], last_debounce_time)
-    return last_debounce_time
 
+def to_queues(people: list[np.ndarray], z_scores: list[float], similarities: list[float], track_ids: list[int] | None, debouncer: "TrackDebounce", leaderboard_mgr: "LeaderboardManager | PipelineEvents", features: Tensor | None = None, queue: "DetectionQueue | PipelineEvents" = annotation_queue, z_cutoff: float | None = None, camera_id: str | None = None, usable: np.ndarray | None = None, quality: np.ndarray | None = None):
+    z_cutoff = Z_CUTOFF if z_cutoff is None else z_cutoff
+    now = time.time()
+    for i, z in enumerate(z_scores):
+        # Crops the quality gate turned down are neither reported nor ranked
+        if usable is not None and not usable[i]:
+            continue
 
-def generate_frames(leaderboard_manager):
-    camera = cv2.VideoCapture(0)
-    if not camera.isOpened():
-        raise RuntimeError("Could not open webcam.")
+        # Without tracks everyone shares one debounce window
+        track_id = track_ids[i] if track_ids is not None else None
+        if not debouncer.ready(track_id, z, now):
+            if z > z_cutoff:
+                debounced_detections.inc()
+            continue
 
-    prev_time = time.time()
+        # Encoded at most once, whoever needs it first
+        person = EncodedImage(people[i])
+        crop_quality = quality[i].tolist() if quality is not None else None
+        reported = to_annotation(person, z, z_cutoff, features[i] if features is not None else None, queue, camera_id, crop_quality)
+        placed = leaderboard_mgr.new_score(person, similarities[i])
+        if reported or placed:
+            debouncer.mark(track_id, z, now)
 
-    last_debounce_time = time.time()
 
-    while True:
-        success, frame = camera.read()
-        if not success:
-            break
+def generate_frames(stream: "CameraStream") -> Iterator[bytes]:
+    grabber = stream.grabber
+    grabber.start()
 
-        # ML processing here
-        people, results = detect_people(frame, classes=[0])
-        z_scores, similarities = assess_people(people)
-        last_debounce_time = to_queues(people, z_scores, similarities, last_debounce_time, leaderboard_manager)
-
-        # Draw bounding boxes and z-scores on the frame
-        draw_z_scores(frame, results, z_scores)
-        prev_time = add_fps_count(frame, prev_time)
-
-        # Encode and yield as part of the MJPEG stream
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        yield (b"--frame\r\n"
-               b"Content-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n")
+    prev_time = time.time()
 
-    camera.release()
+    results, z_scores, track_ids = [], [], []
+
+    try:
+        while True:
+            grabbed = grabber.read()
+            if grabbed is None:
+                break
+            frame, captured_at = grabbed
+
+            # ML processing here, batched with the other cameras, unless the scene is static
+            if stream.motion_gate.should_infer(frame, grabber.capture_interval):
+                started_at = time.time()
+                people, results, z_scores, similarities, track_ids, features, usable, quality = stream.scheduler.infer(frame, stream.tracker, stream.threat_stats)
+                stream.motion_gate.record_inference(started_at, len(people))
+                to_queues(people, z_scores, similarities, track_ids, stream.debouncer, stream.leaderboard_manager, features, stream.annotations, stream.z_cutoff(), stream.camera_id, usable, quality)
+                grabber.mark_done(captured_at)
+
+            # Draw bounding boxes and z-scores on the frame, the last ones found if this frame was skipped
+            draw_z_scores(frame, results, z_scores, track_ids)
+            prev_time = add_fps_count(frame, prev_time)
+
+            # Encode once, the frame hub fans the bytes out to every viewer and
+            # the clip buffer keeps the same bytes
+            frame_bytes = encode_jpeg(frame)
+            stream.clips.append(frame_bytes, captured_at)
+            yield frame_bytes
+    finally:
+        grabber.stop()
+        stream.threat_stats.save()
@@ -0,0 +1,326 @@
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING, Callable, Iterator
+
+import numpy as np
+
+from common import Detection, EncodedImage
+from constants import (CLIP_DIR, CLIP_POST_SECONDS, CLIP_PRE_SECONDS, DETECTION_STATS_INTERVAL, DETECTION_STOP_TIMEOUT,
+                       FRAME_RING_SLOT_SIZE, FRAME_RING_SLOTS)
+from detection_queue import DetectionQueue
+from frame_hub import FrameHub
+from leaderboard_manager import LeaderboardManager
+from quality_gate import DEFAULT_THRESHOLDS
+
+if TYPE_CHECKING:
+    from streams import CameraStream
+
+# Fork is unsafe once torch or the event loop have started threads
+_context = multiprocessing.get_context("spawn")
+
+
+class FrameRing:
+    """
+    Fixed number of encoded frames in shared memory, written by the detection
+    process and read by the API process without pushing frames through a pipe.
+    Every slot records which frame it holds, so a reader that was lapped by
+    the writer while copying notices and reads again.
+    """
+
+    def __init__(self, slots: int = FRAME_RING_SLOTS, slot_size: int = FRAME_RING_SLOT_SIZE, name: str | None = None, ready=None):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ready = ready if ready is not None else _context.Event()
+        self.oversized = 0
+
+        header_size = 8 * (2 + 2 * slots)
+        self._owner = name is None
+        self._shm = SharedMemory(name=name, create=self._owner, size=header_size + slots * slot_size)
+        # Newest sequence number, closed flag, then sequence number and length per slot
+        self._meta = np.ndarray((2 + 2 * slots,), dtype=np.uint64, buffer=self._shm.buf)
+        self._data = np.ndarray((slots, slot_size), dtype=np.uint8, buffer=self._shm.buf, offset=header_size)
+        if self._owner:
+            self._meta[:] = 0
+
+    def __reduce__(self):
+        # Sent to the detection process by name, where it attaches to the same memory
+        return FrameRing, (self.slots, self.slot_size, self._shm.name, self.ready)
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._meta[1])
+
+    def write(self, frame: bytes):
+        if len(frame) > self.slot_size:
+            self.oversized += 1
+            return
+
+        seq = int(self._meta[0]) + 1
+        slot = seq % self.slots
+        self._meta[2 + 2 * slot] = 0  # Being written
+        self._data[slot, :len(frame)] = np.frombuffer(frame, dtype=np.uint8)
+        self._meta[3 + 2 * slot] = len(frame)
+        self._meta[2 + 2 * slot] = seq
+        self._meta[0] = seq
+        self.ready.set()
+
+    def read(self, last_seq: int) -> tuple[int, bytes] | None:
+        """The newest frame and its sequence number, if it is newer than last_seq."""
+        while True:
+            seq = int(self._meta[0])
+            if seq == last_seq:
+                return None
+
+            slot = seq % self.slots
+            length = int(self._meta[3 + 2 * slot])
+            frame = self._data[slot, :length].tobytes()
+            if int(self._meta[2 + 2 * slot]) == seq:
+                return seq, frame
+
+    def frames(self, poll: float = 1.0) -> Iterator[bytes]:
+        last_seq = int(self._meta[0])
+        while True:
+            latest = self.read(last_seq)
+            if latest is not None:
+                last_seq, frame = latest
+                yield frame
+                continue
+            if self.closed:
+                return
+
+            self.ready.wait(poll)
+            self.ready.clear()
+
+    def close(self):
+        self._meta[1] = 1
+        self.ready.set()
+
+    def reopen(self):
+        self._meta[1] = 0
+
+    def unlink(self):
+        # Mappings stay valid until the processes exit, only the name goes away
+        if self._owner:
+            self._shm.unlink()
+
+
+class PipelineEvents:
+    """
+    Stands in for the annotation queue and the leaderboard inside the detection
+    process and forwards detections and leaderboard candidates to the API process.
+    """
+
+    def __init__(self, events: multiprocessing.Queue, cutoffs):
+        self.events = events
+        self.cutoffs = cutoffs
+
+    def put(self, detection: Detection) -> bool:
+        self.events.put(("detection", detection))
+        return True
+
+    def new_score(self, image: EncodedImage, score: float) -> bool:
+        # Checked against the boards as the API process last published them, so
+        # crops that cannot place are neither encoded nor sent
+        threat_floor, nice_ceiling = self.cutoffs[:]
+        if nice_ceiling <= score <= threat_floor:
+            return False
+        self.events.put(("score", image.jpeg, score))
+        return True
+
+
+class DetectionProcess:
+    """Runs capture, inference and drawing for every camera in a separate process, so they never hold up the API."""
+
+    def __init__(
+        self,
+        cameras: dict[str, dict],
+        leaderboard_manager: LeaderboardManager,
+        annotations: DetectionQueue,
+        z_cutoff: Callable[[], float],
+    ):
+        self.cameras = cameras
+        self.leaderboard_manager = leaderboard_manager
+        self.annotations = annotations
+        self.z_cutoff = z_cutoff
+
+        self.rings = {camera_id: FrameRing() for camera_id in cameras}
+        self.hubs = {camera_id: FrameHub(lambda camera_id=camera_id: self.frames(camera_id)) for camera_id in cameras}
+        self.ready = threading.Event()
+
+        self._events: multiprocessing.Queue = _context.Queue()
+        self._commands: multiprocessing.Queue = _context.Queue()
+        self._cutoffs = _context.Array("d", leaderboard_manager.cutoffs(), lock=False)
+        self._z_cutoff = _context.Value("d", z_cutoff(), lock=False)
+        self.quality_thresholds = _context.Array("d", DEFAULT_THRESHOLDS, lock=False)
+        self._process: multiprocessing.Process | None = None
+        self._stats: dict = {}
+        self._clips: dict[str, tuple[str, float, float]] = {}  # camera id -> name, start and end of its latest clip
+
+    def start(self):
+        self._process = _context.Process(
+            target=run_detection,
+            args=(self.cameras, self.rings, self._events, self._commands, self._cutoffs, self._z_cutoff, self.quality_thresholds),
+            name="detection",
+            daemon=True,
+        )
+        self._process.start()
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    def stop(self, timeout: float = DETECTION_STOP_TIMEOUT):
+        if self._process is not None:
+            self._commands.put(("stop",))
+            self._process.join(timeout)
+            if self._process.is_alive():
+                print("Detection process did not stop in time, terminating it")
+                self._process.terminate()
+                self._process.join()
+
+        self._events.put(None)
+        for ring in self.rings.values():
+            ring.close()
+            ring.unlink()
+
+    def frames(self, camera_id: str) -> Iterator[bytes]:
+        ring = self.rings[camera_id]
+        ring.reopen()
+        self._commands.put(("start", camera_id))
+        return ring.frames()
+
+    def record_clip(self, camera_id: str | None, event_time: float, pre: float = CLIP_PRE_SECONDS, post: float = CLIP_POST_SECONDS) -> str | None:
+        """
+        Has the clip around a detection saved and returns its file name, or None
+        if the camera's buffer has already dropped frames the clip should start
+        with. A detection whose clip would overlap one that is still recording
+        extends that one instead.
+        """
+        if camera_id not in self.cameras:
+            return None
+
+        since, until = event_time - pre, event_time + post
+        latest = self._clips.get(camera_id)
+        # Leave the recording a moment to hear about it before it finishes
+        if latest is not None and since <= latest[2] and time.time() + DETECTION_STATS_INTERVAL < latest[2]:
+            # An earlier detection moves the start back too, if the buffer still has those frames
+            if since < latest[1] and not self._buffered(camera_id, since):
+                since = latest[1]
+            name, since, until = latest[0], min(since, latest[1]), max(until, latest[2])
+        else:
+            if not self._buffered(camera_id, since):
+                return None
+            name = f"{camera_id}-{since * 1000:.0f}.mjpeg"
+
+        self._clips[camera_id] = (name, since, until)
+        self._commands.put(("clip", camera_id, os.path.join(CLIP_DIR, name), since, until))
+        return name
+
+    def _buffered(self, camera_id: str, since: float) -> bool:
+        # Stats are up to an interval old, the buffer may have moved on by about as much
+        evicted_until = self._stats.get("streams", {}).get(camera_id, {}).get("clip_buffer", {}).get("evicted_until")
+        return evicted_until is not None and evicted_until + DETECTION_STATS_INTERVAL < since
+
+    def _pump(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+
+            kind, *args = event
+            try:
+                if kind == "detection":
+                    self.annotations.put(args[0])
+                elif kind == "score":
+                    image, score = args
+                    self.leaderboard_manager.new_score(EncodedImage(jpeg=image), score)
+                    self._cutoffs[:] = self.leaderboard_manager.cutoffs()
+                elif kind == "stats":
+                    self._stats = args[0]
+                elif kind == "ready":
+                    self.ready.set()
+                # Stats arrive every DETECTION_STATS_INTERVAL, so this never goes stale for long
+                self._z_cutoff.value = self.z_cutoff()
+            except Exception as e:
+                print(f"Error handling {kind} from the detection process: {e}")
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def stats(self) -> dict:
+        return {"alive": self.alive, **self._stats}
+
+
+def _stream_frames(stream: "CameraStream", ring: FrameRing):
+    try:
+        for frame_bytes in stream.frames():
+            ring.write(frame_bytes)
+    except Exception as e:
+        print(f"Pipeline for {stream.camera_id} stopped: {e}")
+    finally:
+        ring.close()
+
+
+def run_detection(cameras: dict[str, dict], rings: dict[str, FrameRing], events: multiprocessing.Queue, commands: multiprocessing.Queue, cutoffs, z_cutoff, quality_thresholds):
+    """Entry point of the detection process."""
+    # Ctrl+C reaches the whole process group, shutdown is left to the API process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Imported here so the API process never loads torch or the models
+    from detection_layer import ready, warmup
+    from event_clips import ClipWriter
+    from inference_scheduler import InferenceScheduler
+    from quality_gate import QualityGate
+    from streams import create_streams
+
+    pipeline_events = PipelineEvents(events, cutoffs)
+    scheduler = InferenceScheduler(quality_gate=QualityGate(quality_thresholds))
+    streams = create_streams(cameras, pipeline_events, pipeline_events, scheduler, lambda: z_cutoff.value)
+    threads: dict[str, threading.Thread] = {}
+    clips: dict[str, ClipWriter] = {}
+    stopping = threading.Event()
+
+    def run_warmup():
+        warmup()
+        if ready.is_set():
+            events.put(("ready",))
+
+    threading.Thread(target=run_warmup, daemon=True).start()
+
+    while True:
+        try:
+            command, *args = commands.get(timeout=DETECTION_STATS_INTERVAL)
+        except queue.Empty:
+            command, args = None, []
+
+        if command == "stop":
+            break
+        if command == "start":
+            camera_id = args[0]
+            if camera_id not in threads or not threads[camera_id].is_alive():
+                threads[camera_id] = threading.Thread(target=_stream_frames, args=(streams[camera_id], rings[camera_id]), daemon=True)
+                threads[camera_id].start()
+        if command == "clip":
+            camera_id, path, since, until = args
+            # Records on its own thread, capture carries on
+            clips = {clip_path: writer for clip_path, writer in clips.items() if writer.alive}
+            if path not in clips or not clips[path].extend(since, until):
+                clips[path] = ClipWriter(streams[camera_id].clips, path, since, until, stopping)
+
+        events.put(("stats", {
+            "inference": scheduler.stats(),
+            "streams": {camera_id: {**stream.stats(), "oversized_frames": rings[camera_id].oversized} for camera_id, stream in streams.items()},
+        }))
+
+    # Stopping the grabbers ends each pipeline, which saves its threat baseline on the way out.
+    # Clips still waiting for frames are written with what there is
+    stopping.set()
+    for stream in streams.values():
+        stream.grabber.stop()
+    for thread in threads.values():
+        thread.join(DETECTION_STOP_TIMEOUT)
+    for writer in clips.values():
+        writer.join(DETECTION_STOP_TIMEOUT)
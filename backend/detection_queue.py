@@ -0,0 +1,77 @@
+import threading
+import time
+
+from common import Detection
+from constants import ANNOTATION_QUEUE_SIZE, ANNOTATION_TTL
+from waiters import Waiters
+
+
+class DetectionQueue:
+    """
+    Bounded, thread-safe queue of detections waiting for the decision layer.
+    The highest z-score comes out first, the lowest (then oldest) is evicted
+    when the queue is full, and entries older than the TTL are discarded.
+    Producers are plain threads, consumers await get() on the event loop.
+    """
+
+    def __init__(self, maxsize: int = ANNOTATION_QUEUE_SIZE, ttl: float = ANNOTATION_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._items: list[Detection] = []
+        self._lock = threading.Lock()
+        self._waiters = Waiters()
+
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _expire(self):
+        deadline = time.time() - self.ttl
+        fresh = [item for item in self._items if item.created_at >= deadline]
+        self.expired += len(self._items) - len(fresh)
+        self._items = fresh
+
+    def put(self, detection: Detection) -> bool:
+        with self._lock:
+            self._expire()
+            if len(self._items) >= self.maxsize:
+                lowest = min(self._items, key=lambda item: (item.score, item.created_at))
+                if detection.score <= lowest.score:
+                    self.evicted += 1
+                    return False
+                self._items.remove(lowest)
+                self.evicted += 1
+            self._items.append(detection)
+        self._waiters.notify()
+        return True
+
+    def get_nowait(self) -> Detection | None:
+        with self._lock:
+            self._expire()
+            if not self._items:
+                return None
+            highest = max(self._items, key=lambda item: (item.score, -item.created_at))
+            self._items.remove(highest)
+            return highest
+
+    async def get(self) -> Detection:
+        detection = await self.get_within(None)
+        assert detection is not None
+        return detection
+
+    async def get_within(self, timeout: float | None) -> Detection | None:
+        """The next detection, or None if none arrives within the timeout."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._waiters.waiter() as waiter:
+            while True:
+                detection = self.get_nowait()
+                if detection is not None:
+                    return detection
+                if not await waiter.wait(deadline - time.monotonic() if deadline is not None else None):
+                    return None
+
+
+annotation_queue: DetectionQueue = DetectionQueue()
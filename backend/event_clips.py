@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from constants import CLIP_BUFFER_BYTES, CLIP_BUFFER_FRAMES
+
+# How often a clip being recorded picks up new frames, and how long it waits past its end for the last ones
+CLIP_POLL_INTERVAL = 1.0
+
+
+class ClipBuffer:
+    """
+    The most recent encoded frames of a stream, as many as fit in max_bytes
+    and max_frames, to cut clips from when something is escalated. Frames are
+    copied back to back into one preallocated byte ring, with their offsets,
+    lengths, timestamps and sequence numbers in fixed-size arrays beside it,
+    so memory stays flat and adding a frame is a single copy. Readers copy
+    frames out without holding up the writer and drop any that were
+    overwritten meanwhile.
+    """
+
+    def __init__(self, max_bytes: int = CLIP_BUFFER_BYTES, max_frames: int = CLIP_BUFFER_FRAMES):
+        self.oversized = 0
+        self.evicted_until = 0.0  # Timestamp of the newest frame dropped so far
+
+        self._data = np.empty(max_bytes, dtype=np.uint8)
+        self._starts = np.zeros(max_frames, dtype=np.int64)
+        self._lengths = np.zeros(max_frames, dtype=np.int64)
+        self._times = np.zeros(max_frames, dtype=np.float64)
+        self._seqs = np.zeros(max_frames, dtype=np.int64)
+        self._first = 0  # Index of the oldest frame
+        self._count = 0
+        self._next_seq = 0
+        self._lock = threading.Lock()
+
+    def append(self, frame: bytes, timestamp: float):
+        size = len(frame)
+        if size > len(self._data):
+            self.oversized += 1
+            return
+
+        slots = len(self._times)
+        with self._lock:
+            # Straight after the newest frame, or back at the start if it does not fit there,
+            # in which case the frames left at the end are the oldest and go first
+            offset, tail = 0, len(self._data)
+            if self._count:
+                newest = (self._first + self._count - 1) % slots
+                offset = int(self._starts[newest] + self._lengths[newest])
+                if offset + size > len(self._data):
+                    offset, tail = 0, offset
+
+            # Frames are laid out in order, so whatever is in the way is always the oldest
+            while self._count:
+                start, length = self._starts[self._first], self._lengths[self._first]
+                in_the_way = start >= tail or (start < offset + size and offset < start + length)
+                if not (in_the_way or self._count == slots):
+                    break
+                self.evicted_until = float(self._times[self._first])
+                self._first = (self._first + 1) % slots
+                self._count -= 1
+
+            index = (self._first + self._count) % slots
+            self._data[offset:offset + size] = np.frombuffer(frame, dtype=np.uint8)
+            self._starts[index], self._lengths[index], self._times[index] = offset, size, timestamp
+            self._seqs[index] = self._next_seq
+            self._next_seq += 1
+            self._count += 1
+
+    def _oldest_seq(self) -> int:
+        return int(self._seqs[self._first]) if self._count else self._next_seq
+
+    def frames(self, since: float, until: float) -> list[tuple[float, bytes]]:
+        """Timestamps and copies of the frames captured between since and until, oldest first."""
+        with self._lock:
+            indices = (self._first + np.arange(self._count)) % len(self._times)
+            indices = indices[(self._times[indices] >= since) & (self._times[indices] <= until)]
+            starts, lengths = self._starts[indices], self._lengths[indices]
+            times, seqs = self._times[indices], self._seqs[indices]
+
+        # Copied without the lock, so the pipeline is never kept waiting on a long clip
+        copies = [self._data[start:start + length].tobytes() for start, length in zip(starts, lengths)]
+
+        # Frames are only overwritten after being evicted, so anything still held was copied intact
+        with self._lock:
+            oldest = self._oldest_seq()
+        return [(float(timestamp), copy) for timestamp, copy, seq in zip(times, copies, seqs) if seq >= oldest]
+
+    def stats(self) -> dict:
+        with self._lock:
+            indices = (self._first + np.arange(self._count)) % len(self._times)
+            return {
+                "frames": self._count,
+                "seconds": float(self._times[indices[-1]] - self._times[indices[0]]) if self._count else 0.0,
+                "bytes": int(self._lengths[indices].sum()),
+                "evicted_until": self.evicted_until,
+                "oversized_frames": self.oversized,
+            }
+
+
+class ClipWriter:
+    """
+    Records one clip out of a ClipBuffer as Motion JPEG. The frames from before
+    the detection are written straight away and later ones as they come in,
+    so nothing piles up in memory. Detections overlapping the clip extend it
+    for as long as it is still recording, one from earlier has it start over
+    from the earlier frames.
+    """
+
+    def __init__(self, buffer: ClipBuffer, path: str, since: float, until: float, stopping: threading.Event):
+        self.buffer = buffer
+        self.path = path
+        self.since = since
+        self.until = until
+        self.stopping = stopping
+
+        self._lock = threading.Lock()
+        self._done = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def extend(self, since: float, until: float) -> bool:
+        """Widen the clip to cover since to until, False if it has already been finished."""
+        with self._lock:
+            if self._done:
+                return False
+            self.since = min(self.since, since)
+            self.until = max(self.until, until)
+            return True
+
+    def join(self, timeout: float | None = None):
+        self._thread.join(timeout)
+
+    def _run(self):
+        written, written_since, written_until = 0, float("inf"), float("-inf")
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Written aside and renamed, so a clip is either complete or not there
+            with open(f"{self.path}.part", "wb") as f:
+                while True:
+                    with self._lock:
+                        since, until = self.since, self.until
+                        # Frames reach the buffer a little after their capture time
+                        self._done = self.stopping.is_set() or time.time() >= until + CLIP_POLL_INTERVAL
+
+                    # The clip now starts earlier than what was written, rewrite it from there
+                    if since < written_since:
+                        f.seek(0)
+                        f.truncate()
+                        written, written_since, written_until = 0, since, float("-inf")
+
+                    for timestamp, frame in self.buffer.frames(max(since, written_until), until):
+                        if timestamp > written_until:
+                            f.write(frame)
+                            written, written_until = written + 1, timestamp
+
+                    if self._done:
+                        break
+                    self.stopping.wait(CLIP_POLL_INTERVAL)
+
+            if written:
+                os.replace(f"{self.path}.part", self.path)
+            else:
+                print(f"No frames buffered for clip {self.path}")
+                os.remove(f"{self.path}.part")
+        except OSError as e:
+            print(f"Error saving clip {self.path}: {e}")
+        finally:
+            with self._lock:
+                self._done = True
@@ -0,0 +1,76 @@
+import threading
+from typing import AsyncIterator, Callable, Iterator
+
+from waiters import Waiters
+
+
+class FrameHub:
+    """
+    Runs one frame producer in a background thread and fans the latest encoded
+    frame out to any number of async subscribers. Subscribers only ever see the
+    newest frame, so a slow client skips frames instead of building a backlog.
+    """
+
+    def __init__(self, producer: Callable[[], Iterator[bytes]]):
+        self.producer = producer
+        self.latest: bytes | None = None
+        self.seq = 0
+
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._waiters = Waiters()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            for frame_bytes in self.producer():
+                self.publish(frame_bytes)
+        except Exception as e:
+            print(f"Frame producer stopped: {e}")
+        finally:
+            # Wake everyone up so they notice the producer is gone
+            self.publish(None)
+
+    def publish(self, frame_bytes: bytes | None):
+        with self._lock:
+            self.latest = frame_bytes
+            self.seq += 1
+        self._waiters.notify()
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        self.start()
+
+        last_seq = 0
+        with self._waiters.waiter() as waiter:
+            while True:
+                await waiter.wait()
+
+                with self._lock:
+                    seq, frame_bytes = self.seq, self.latest
+                if seq == last_seq:
+                    continue
+                last_seq = seq
+
+                if frame_bytes is None:
+                    return
+                yield frame_bytes
+
+
+async def mjpeg_stream(hub: FrameHub) -> AsyncIterator[bytes]:
+    async for frame_bytes in hub.subscribe():
+        yield (b"--frame\r\n"
+               b"Content-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n")
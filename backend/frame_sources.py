@@ -0,0 +1,106 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+class PacedSource:
+    """
+    Wraps a finite source so that it is read at its native frame rate instead
+    of as fast as possible, which makes recorded footage behave like a camera.
+    """
+
+    def __init__(self, fps: float, realtime: bool, loop: bool):
+        self.fps = fps
+        self.realtime = realtime
+        self.loop = loop
+        self._started_at: float | None = None
+        self._index = 0
+
+    def _pace(self):
+        if not self.realtime or self.fps <= 0:
+            return
+        if self._started_at is None:
+            self._started_at = time.time()
+        due = self._started_at + self._index / self.fps
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        self._index += 1
+
+    def set(self, prop_id: int, value: float) -> bool:
+        return False
+
+
+class VideoFileSource(PacedSource):
+    def __init__(self, path: str, realtime: bool = True, loop: bool = False):
+        self.capture = cv2.VideoCapture(path)
+        super().__init__(self.capture.get(cv2.CAP_PROP_FPS) or 30.0, realtime, loop)
+
+    def isOpened(self) -> bool:
+        return self.capture.isOpened()
+
+    def read(self) -> tuple[bool, np.ndarray | None]:
+        self._pace()
+        success, frame = self.capture.read()
+        if not success and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = self.capture.read()
+        return success, frame
+
+    def release(self):
+        self.capture.release()
+
+
+class ImageDirectorySource(PacedSource):
+    def __init__(self, path: str, fps: float = 10.0, realtime: bool = True, loop: bool = False):
+        super().__init__(fps, realtime, loop)
+        self.files = sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.lower().endswith((".jpg", ".jpeg"))
+        ) if os.path.isdir(path) else []
+        self._position = 0
+
+    def isOpened(self) -> bool:
+        return len(self.files) > 0
+
+    def read(self) -> tuple[bool, np.ndarray | None]:
+        if self._position >= len(self.files):
+            if not self.loop or not self.files:
+                return False, None
+            self._position = 0
+
+        self._pace()
+        frame = cv2.imread(self.files[self._position])
+        self._position += 1
+        return frame is not None, frame
+
+    def release(self):
+        self._position = len(self.files)
+
+
+def open_source(settings: dict):
+    """
+    Open a frame source from its settings. Every source exposes the subset of
+    the cv2.VideoCapture interface the pipeline uses (isOpened, read, set, release).
+
+        {"type": "webcam", "index": 0}
+        {"type": "stream", "url": "rtsp://..."}
+        {"type": "video", "path": "clip.mp4", "realtime": True, "loop": False}
+        {"type": "images", "path": "frames/", "fps": 10, "realtime": True, "loop": False}
+    """
+    source_type = settings.get("type", "webcam")
+
+    if source_type == "webcam":
+        return cv2.VideoCapture(settings.get("index", 0))
+    if source_type == "stream":
+        return cv2.VideoCapture(settings["url"])
+    if source_type == "video":
+        return VideoFileSource(settings["path"], settings.get("realtime", True), settings.get("loop", False))
+    if source_type == "images":
+        return ImageDirectorySource(
+            settings["path"], settings.get("fps", 10.0), settings.get("realtime", True), settings.get("loop", False)
+        )
+
+    raise ValueError(f"Unknown frame source type: {source_type}")
@@ -0,0 +1,335 @@
+import ast
+import glob
+import hashlib
+import os
+from typing import List
+
+import clip
+from clip.model import ModifiedResNet, VisionTransformer, convert_weights
+import cv2
+import numpy as np
+import torch
+from torch import Tensor
+from ultralytics import YOLO
+from ultralytics.data.augment import LetterBox
+from ultralytics.engine.results import Results
+from ultralytics.utils import ops
+
+from constants import (CLIP_MODEL, INFERENCE_BACKEND, INFERENCE_CALIBRATION_DIR, INFERENCE_CALIBRATION_FRAMES,
+                       INFERENCE_DEVICE, INFERENCE_INT8, INFERENCE_THREADS, MODEL_CACHE_DIR, YOLO_WEIGHTS)
+
+
+def pick_device(requested: str = INFERENCE_DEVICE) -> str:
+    if requested != "auto":
+        return requested
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def load_clip_visual(device: str) -> torch.nn.Module:
+    """
+    The CLIP image tower on its own, built from just its weights. Those are
+    cut out of the full checkpoint once and cached in MODEL_CACHE_DIR, so the
+    text tower is never loaded on later starts.
+    """
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    path = os.path.join(MODEL_CACHE_DIR, f"clip_{CLIP_MODEL.replace('/', '-')}_visual.pt")
+    if not os.path.exists(path):
+        clip_model, _ = clip.load(CLIP_MODEL, device="cpu")
+        torch.save({key.removeprefix("visual."): value for key, value in clip_model.state_dict().items() if key.startswith("visual.")}, path)
+
+    # Sized from the weights the way clip.model.build_model does it
+    state_dict = torch.load(path, map_location="cpu")
+    if "proj" in state_dict:
+        width, patch_size = state_dict["conv1.weight"].shape[0], state_dict["conv1.weight"].shape[-1]
+        visual = VisionTransformer(
+            input_resolution=patch_size * round((state_dict["positional_embedding"].shape[0] - 1) ** 0.5),
+            patch_size=patch_size,
+            width=width,
+            layers=len([key for key in state_dict if key.endswith(".attn.in_proj_weight")]),
+            heads=width // 64,
+            output_dim=state_dict["proj"].shape[1],
+        )
+    else:
+        width = state_dict["layer1.0.conv1.weight"].shape[0]
+        visual = ModifiedResNet(
+            layers=tuple(len({key.split(".")[1] for key in state_dict if key.startswith(f"layer{block}.")}) for block in range(1, 5)),
+            output_dim=state_dict["attnpool.c_proj.weight"].shape[0],
+            heads=width * 32 // 64,
+            input_resolution=32 * round((state_dict["attnpool.positional_embedding"].shape[0] - 1) ** 0.5),
+            width=width,
+        )
+    visual.load_state_dict(state_dict)
+    visual = visual.eval().to(device)
+    # Half precision off the CPU, as clip.load has it
+    if device != "cpu":
+        convert_weights(visual)
+    return visual
+
+
+def load_text_features(prompts: list[str], device: str) -> Tensor:
+    """
+    Normalised CLIP text embeddings for the prompts, computed once and cached
+    in MODEL_CACHE_DIR so the text tower is never loaded on later starts.
+    """
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    key = hashlib.sha1("\n".join([CLIP_MODEL, *prompts]).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(MODEL_CACHE_DIR, f"text_features_{key}.pt")
+
+    if os.path.exists(path):
+        text_features = torch.load(path, map_location="cpu")
+    else:
+        clip_model, _ = clip.load(CLIP_MODEL, device="cpu")
+        with torch.no_grad():
+            text_features = clip_model.encode_text(clip.tokenize(prompts)).float()
+            text_features /= text_features.norm(dim=-1, keepdim=True)
+        torch.save(text_features, path)
+
+    return text_features.to(device)
+
+
+def synchronize(device: str):
+    # Kernels run asynchronously, wait for them so timings land in the right stage
+    if device == "cuda":
+        torch.cuda.synchronize()
+    elif device == "mps":
+        torch.mps.synchronize()
+
+
+class InferenceBackend:
+    """YOLO and the CLIP image tower, run however the backend runs them."""
+
+    name: str
+    device: str
+
+    def predict(self, imgs: list[np.ndarray], classes: list[int], conf: float) -> List[Results]:
+        raise NotImplementedError
+
+    def encode_image(self, people: Tensor) -> Tensor:
+        raise NotImplementedError
+
+
+class TorchBackend(InferenceBackend):
+    """YOLO and CLIP run as PyTorch models on whatever device is available."""
+
+    name = "torch"
+
+    def __init__(self, device: str):
+        self.device = device
+        self.yolo_model = YOLO(YOLO_WEIGHTS)
+        self.clip_visual = load_clip_visual(device)
+
+    def predict(self, imgs: list[np.ndarray], classes: list[int], conf: float) -> List[Results]:
+        return self.yolo_model.predict(imgs, classes=classes, conf=conf, device=self.device, verbose=False)
+
+    def encode_image(self, people: Tensor) -> Tensor:
+        return self.clip_visual(people.type(self.clip_visual.conv1.weight.dtype))
+
+
+class ExportedBackend(InferenceBackend):
+    """
+    YOLO and the CLIP image tower exported to ONNX, optionally quantized to
+    INT8, and run by ONNX Runtime on the CPU or through its OpenVINO provider.
+    Exports are cached in MODEL_CACHE_DIR, and the PyTorch models are only
+    loaded to create them.
+    """
+
+    def __init__(self, name: str, int8: bool = INFERENCE_INT8, threads: int = INFERENCE_THREADS):
+        self.device = "cpu"
+        self.name = name
+        self.int8 = int8
+        self.threads = threads
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+
+        self.yolo_session = self._session(self._export_yolo())
+        self.yolo_names = ast.literal_eval(self.yolo_session.get_modelmeta().custom_metadata_map["names"])
+        self.clip_session = self._session(self._export_clip())
+
+    def _session(self, path: str):
+        # Both models get the same threads and providers
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads > 0:
+            options.intra_op_num_threads = self.threads
+        providers: list = ["CPUExecutionProvider"]
+        if self.name == "openvino" and "OpenVINOExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, ("OpenVINOExecutionProvider", {"num_of_threads": self.threads} if self.threads > 0 else {}))
+        return ort.InferenceSession(path, options, providers=providers)
+
+    def _artifact(self, stem: str, suffix: str) -> str:
+        precision = "int8" if self.int8 else "fp32"
+        return os.path.join(MODEL_CACHE_DIR, f"{stem}_{precision}{suffix}")
+
+    def _export_yolo(self) -> str:
+        target = self._artifact(os.path.splitext(os.path.basename(YOLO_WEIGHTS))[0], ".onnx")
+        if not os.path.exists(target):
+            exported = YOLO(YOLO_WEIGHTS).export(format="onnx", dynamic=True)
+            if self.int8:
+                quantize_yolo(exported, target, calibration_frames())
+                os.remove(exported)
+            else:
+                os.replace(exported, target)
+        return target
+
+    def _export_clip(self) -> str:
+        target = self._artifact("clip_" + CLIP_MODEL.replace("/", "-"), "_visual.onnx")
+        if os.path.exists(target):
+            return target
+
+        fp32_path = target if not self.int8 else target + ".fp32"
+        visual = load_clip_visual("cpu")
+        with torch.no_grad():
+            torch.onnx.export(
+                visual,
+                (torch.zeros(1, 3, 224, 224),),
+                fp32_path,
+                input_names=["image"],
+                output_names=["features"],
+                dynamic_axes={"image": {0: "batch"}, "features": {0: "batch"}},
+                opset_version=17,
+                dynamo=False,
+            )
+        if self.int8:
+            quantize_clip(fp32_path, target)
+            os.remove(fp32_path)
+        return target
+
+    def predict(self, imgs: list[np.ndarray], classes: list[int], conf: float) -> List[Results]:
+        # Pre- and postprocessing as ultralytics does it, the session in between is ours
+        inputs = yolo_inputs(imgs)
+        predictions = self.yolo_session.run(None, {self.yolo_session.get_inputs()[0].name: inputs})[0]
+        detections = ops.non_max_suppression(torch.from_numpy(predictions), conf_thres=conf, iou_thres=0.7, classes=classes)
+
+        results = []
+        for img, boxes in zip(imgs, detections):
+            boxes[:, :4] = ops.scale_boxes(inputs.shape[2:], boxes[:, :4], img.shape)
+            results.append(Results(img, path="", names=self.yolo_names, boxes=boxes))
+        return results
+
+    def encode_image(self, people: Tensor) -> Tensor:
+        features = self.clip_session.run(None, {"image": people.float().cpu().numpy()})[0]
+        return torch.from_numpy(features)
+
+
+def quantize_clip(source: str, target: str):
+    # Dynamic quantization needs no calibration data and suits the CLIP transformer best. Only its
+    # matrix multiplies, a quantized patch embedding becomes a ConvInteger the CPU provider can't run
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8, op_types_to_quantize=["MatMul", "Gemm"])
+
+
+def calibration_frames(directory: str = INFERENCE_CALIBRATION_DIR, limit: int = INFERENCE_CALIBRATION_FRAMES) -> list[np.ndarray]:
+    # Frames from the cameras themselves calibrate best, the ultralytics sample images are the fallback
+    paths = sorted(glob.glob(os.path.join(directory, "*.jpg")))
+    if not paths:
+        from ultralytics.utils import ASSETS
+        paths = sorted(str(path) for path in ASSETS.glob("*.jpg"))
+    frames = [cv2.imread(path) for path in paths[:limit]]
+    return [frame for frame in frames if frame is not None]
+
+
+def yolo_inputs(frames: list[np.ndarray], size: int = 640) -> np.ndarray:
+    # Letterboxed, RGB, NCHW in [0, 1], as ultralytics feeds its dynamic ONNX exports. Frames
+    # that are all the same size are only padded up to the stride, not to a square
+    letterbox = LetterBox((size, size), auto=len({frame.shape for frame in frames}) == 1, stride=32)
+    batch = np.stack([letterbox(image=frame) for frame in frames])
+    return np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32) / 255
+
+
+def quantize_yolo(source: str, target: str, frames: list[np.ndarray]):
+    """
+    Static INT8 for YOLO, which is almost all convolutions: activation ranges
+    are calibrated on the frames and the model is written as QDQ, which the
+    CPU provider runs as QLinearConv. Box decoding after the convolutions
+    stays in float.
+    """
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = onnx.load(source, load_external_data=False).graph.input[0].name
+
+    class Frames(CalibrationDataReader):
+        def __init__(self):
+            self._inputs = iter([{input_name: yolo_inputs([frame])} for frame in frames])
+
+        def get_next(self):
+            return next(self._inputs, None)
+
+    quantize_static(
+        source,
+        target,
+        Frames(),
+        quant_format=QuantFormat.QDQ,
+        op_types_to_quantize=["Conv"],
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+
+
+def load_backend(name: str = INFERENCE_BACKEND, device: str = INFERENCE_DEVICE) -> InferenceBackend:
+    device = pick_device(device)
+    if name == "auto":
+        name = "torch" if device != "cpu" else "onnx"
+
+    if name == "torch":
+        return TorchBackend(device)
+    if name in ("onnx", "openvino"):
+        return ExportedBackend(name)
+    raise ValueError(f"Unknown inference backend: {name}")
+
+
+def check_parity(frames: list[np.ndarray], exported: InferenceBackend, reference: InferenceBackend) -> dict:
+    """
+    Compare an exported backend against the PyTorch one on the same frames:
+    how many people each finds, how well the boxes overlap and how close the
+    CLIP embeddings of the reference boxes are.
+    """
+    from detection_layer import person_boxes, preprocess_people
+    from tracker import box_iou
+
+    box_ious, similarities, count_mismatches = [], [], 0
+    for frame in frames:
+        reference_boxes = person_boxes(reference.predict([frame], classes=[0], conf=0.5)).cpu()
+        exported_boxes = person_boxes(exported.predict([frame], classes=[0], conf=0.5)).cpu()
+        if len(reference_boxes) != len(exported_boxes):
+            count_mismatches += 1
+        if len(reference_boxes) == 0:
+            continue
+        if len(exported_boxes) > 0:
+            box_ious.extend(box_iou(reference_boxes.numpy(), exported_boxes.numpy()).max(axis=1).tolist())
+
+        people = preprocess_people(frame, reference_boxes).cpu()
+        with torch.no_grad():
+            reference_features = reference.encode_image(people.to(reference.device)).float().cpu()
+            exported_features = exported.encode_image(people).float().cpu()
+        similarities.extend(torch.nn.functional.cosine_similarity(reference_features, exported_features).tolist())
+
+    return {
+        "frames": len(frames),
+        "count_mismatches": count_mismatches,
+        "mean_box_iou": float(np.mean(box_ious)) if box_ious else None,
+        "min_embedding_similarity": min(similarities) if similarities else None,
+        "mean_embedding_similarity": float(np.mean(similarities)) if similarities else None,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import cv2
+
+    parser = argparse.ArgumentParser(description="Check an exported inference backend against PyTorch.")
+    parser.add_argument("images", nargs="+", help="JPEG frames to compare on")
+    parser.add_argument("--backend", default="onnx", choices=["onnx", "openvino"])
+    parser.add_argument("--int8", action="store_true")
+    args = parser.parse_args()
+
+    frames = [cv2.imread(path) for path in args.images]
+    print(check_parity(frames, ExportedBackend(args.backend, int8=args.int8), TorchBackend(pick_device())))
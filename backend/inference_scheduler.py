@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Tuple
+
+import numpy as np
+import torch
+from torch import Tensor
+from ultralytics.engine.results import Results
+
+from constants import INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT
+from detection_layer import detect_people_batch, embed_people, person_boxes, preprocess_people, score_people
+from quality_gate import QualityGate
+from threat_stats import ThreatStats
+from tracker import IoUTracker
+
+InferenceResult = Tuple[list[np.ndarray], list[Results], list[float], list[float], list[int], Tensor | None, np.ndarray, np.ndarray]
+
+
+class InferenceScheduler:
+    """
+    Collects frames from every active camera and runs them through YOLO and
+    CLIP in batches, so the accelerator is not stuck at batch size 1 when
+    several streams are running. Each caller gets its own results back.
+    Crops the quality gate turns down never reach CLIP.
+    """
+
+    def __init__(self, max_batch: int = INFERENCE_MAX_BATCH, max_wait: float = INFERENCE_MAX_WAIT, quality_gate: QualityGate | None = None):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.quality_gate = quality_gate if quality_gate is not None else QualityGate()
+
+        self._requests: queue.Queue[tuple[np.ndarray, IoUTracker, ThreatStats, Future]] = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+        self.batches = 0
+        self.frames = 0
+        self.crops = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def submit(self, frame: np.ndarray, tracker: IoUTracker, stats: ThreatStats) -> Future:
+        self.start()
+        future: Future = Future()
+        self._requests.put((frame, tracker, stats, future))
+        return future
+
+    def infer(self, frame: np.ndarray, tracker: IoUTracker, stats: ThreatStats) -> InferenceResult:
+        return self.submit(frame, tracker, stats).result()
+
+    def _collect(self) -> list[tuple[np.ndarray, IoUTracker, ThreatStats, Future]]:
+        batch = [self._requests.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self._process(
+                    [frame for frame, _, _, _ in batch],
+                    [tracker for _, tracker, _, _ in batch],
+                    [stats for _, _, stats, _ in batch],
+                )
+            except Exception as e:
+                for *_, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (*_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _process(self, frames: list[np.ndarray], trackers: list[IoUTracker], stats: list[ThreatStats]) -> list[InferenceResult]:
+        detections = detect_people_batch(frames, classes=[0])
+        now = time.time()
+
+        boxes = [person_boxes(results) for _, results in detections]
+        box_arrays = [frame_boxes.cpu().numpy() for frame_boxes in boxes]
+        tracks = [tracker.update(frame_boxes) for tracker, frame_boxes in zip(trackers, box_arrays)]
+        checks = [self.quality_gate.check(frame, frame_boxes) for frame, frame_boxes in zip(frames, box_arrays)]
+
+        # Only usable crops of people who are new, moved a lot or are due a refresh
+        # go through CLIP, in one pass over every frame of the batch
+        to_embed = [
+            [i for i, track in enumerate(frame_tracks) if usable[i] and track.needs_embedding(now)]
+            for frame_tracks, (usable, _) in zip(tracks, checks)
+        ]
+        people_batch = torch.cat([
+            preprocess_people(frame, frame_boxes[indices])
+            for frame, frame_boxes, indices in zip(frames, boxes, to_embed)
+        ], dim=0)
+        image_features = embed_people(people_batch)
+
+        outputs = []
+        offset = 0
+        for (people, results), tracker, frame_stats, frame_tracks, indices, (usable, quality) in zip(detections, trackers, stats, tracks, to_embed, checks):
+            for i in indices:
+                frame_tracks[i].set_features(image_features[offset], now) # type: ignore
+                offset += 1
+
+            # A track turned down before it was ever embedded has nothing to score yet
+            scored = [i for i, track in enumerate(frame_tracks) if track.features is not None]
+            tracker.embedded += len(indices)
+            tracker.reused += len(scored) - len(indices)
+
+            features, z_scores, similarities = self._score(frame_tracks, scored, frame_stats)
+            outputs.append((people, results, z_scores, similarities, [track.id for track in frame_tracks], features, usable, quality))
+
+        self.batches += 1
+        self.frames += len(frames)
+        self.crops += offset
+        return outputs
+
+    @staticmethod
+    def _score(frame_tracks: list, scored: list[int], stats: ThreatStats) -> tuple[Tensor | None, list[float], list[float]]:
+        if len(scored) == len(frame_tracks):
+            features = torch.stack([track.features for track in frame_tracks]) if frame_tracks else None
+            return features, *score_people(features, stats)
+
+        z_scores, similarities = [0.0] * len(frame_tracks), [0.0] * len(frame_tracks)
+        if not scored:
+            return None, z_scores, similarities
+
+        scored_features = torch.stack([frame_tracks[i].features for i in scored])
+        scored_z, scored_similarities = score_people(scored_features, stats)
+        for j, i in enumerate(scored):
+            z_scores[i], similarities[i] = scored_z[j], scored_similarities[j]
+        # Kept aligned with the people, the unscored rows are never reported
+        features = scored_features.new_zeros((len(frame_tracks), scored_features.shape[1]))
+        features[scored] = scored_features
+        return features, z_scores, similarities
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "crops": self.crops,
+            "avg_batch_size": self.frames / self.batches if self.batches else 0.0,
+            "quality": self.quality_gate.stats(),
+        }
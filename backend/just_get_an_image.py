@@ -1,16 +1,19 @@
 import cv2
 import base64
 
+from constants import CAMERAS
+from frame_sources import open_source
+
 # Function to convert an image to a base64-encoded string
 def frame_to_base64(frame):
     _, buffer = cv2.imencode('.jpg', frame)  # Encode the frame as a JPEG
     base64_string = base64.b64encode(buffer).decode('utf-8')  # Convert to base64
     return base64_string
 
-def get_cam_image():
-    camera = cv2.VideoCapture(0)  # Open the default webcam
+def get_cam_image(camera_id: str = "default"):
+    camera = open_source(CAMERAS[camera_id])
     if not camera.isOpened():
-        print("Error: Could not access the webcam.")
+        print(f"Error: Could not open camera {camera_id}.")
         return None
 
     last_frame = None
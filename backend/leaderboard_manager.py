@@ -1,68 +1,216 @@
+import base64
+import hashlib
+import heapq
+import itertools
+import math
+import os
 import pickle
+import sqlite3
+import threading
 import time
 
+import cv2
 import numpy as np
+from pydantic import BaseModel
+
+from batched_writer import BatchedWriter
+from common import EncodedImage, Score, encode_jpeg
+from constants import LEADERBOARD_DB, LEADERBOARD_SIZE, THUMBNAIL_SIZE
+
+THREAT = "threat"
+NICE = "nice"
+
+
+class ScoreRecord(BaseModel):
+    id: str
+    name: str
+    score: float
+    image: bytes  # Raw JPEG
+    thumbnail: bytes | None = None  # Made on first request
+
+    def to_score(self) -> Score:
+        return Score(
+            id=self.id,
+            image=f"/images/{self.id}",
+            thumbnail=f"/images/{self.id}?thumbnail=true",
+            name=self.name,
+            score=self.score,
+        )
+
+    def get_thumbnail(self) -> bytes:
+        if self.thumbnail is None:
+            image = cv2.imdecode(np.frombuffer(self.image, dtype=np.uint8), cv2.IMREAD_COLOR)
+            height, width = image.shape[:2]
+            scale = THUMBNAIL_SIZE / max(height, width)
+            if scale < 1:
+                image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+            self.thumbnail = encode_jpeg(image)
+        return self.thumbnail
+
+
+def image_etag(data: bytes) -> str:
+    return f'"{hashlib.sha1(data).hexdigest()}"'
 
-from common import Score, encode
 
 class LeaderboardManager:
-    def __init__(self):
-        self.threat_leaderboard: list[Score]
-        self.nice_leaderboard: list[Score]
+    """
+    Keeps the top LEADERBOARD_SIZE highest (threat) and lowest (nice) scores
+    in bounded heaps and persists changes to SQLite from a background thread,
+    so qualifying a new score never waits on disk.
+    """
+
+    def __init__(self, db_path: str = LEADERBOARD_DB, size: int = LEADERBOARD_SIZE):
+        self.db_path = db_path
+        self.size = size
+
+        # Heaps keyed so the weakest entry is at the root
+        self._threat: list[tuple[float, int, ScoreRecord]] = []
+        self._nice: list[tuple[float, int, ScoreRecord]] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+        # Changes whenever either board does, for conditional GETs
+        self._started_at = int(time.time())
+        self.version = 0
+
+        self._writes = BatchedWriter(self._connect, self._write, "leaderboard")
         self.init_leaderboard()
-    
+        self._writes.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            " board TEXT NOT NULL, id TEXT NOT NULL, name TEXT NOT NULL, score REAL NOT NULL,"
+            " image BLOB NOT NULL, PRIMARY KEY (board, id))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS scores_by_board ON scores (board, score)")
+        return connection
+
     def init_leaderboard(self):
+        connection = self._connect()
         try:
-            with open('./threat_leaderboard.pkl', 'rb') as f:
-                self.threat_leaderboard = pickle.load(f)
-        except FileNotFoundError:
-                self.threat_leaderboard: list[Score] = []
+            if connection.execute("SELECT COUNT(*) FROM scores").fetchone()[0] == 0:
+                self._import_pickles(connection)
 
-        try:
-            with open('./nice_leaderboard.pkl', 'rb') as f:
-                self.nice_leaderboard = pickle.load(f)
-        except FileNotFoundError:
-                self.nice_leaderboard: list[Score] = []
-
-    def save_leaderboard(self):
-        with open('./threat_leaderboard.pkl', 'wb') as f:
-            pickle.dump(self.threat_leaderboard, f)
-        with open('./nice_leaderboard.pkl', 'wb') as f:
-            pickle.dump(self.nice_leaderboard, f)
-    
-    def new_score(self, image: np.ndarray, score: float, last_debounce: float):
-        threat_eligible = (len(self.threat_leaderboard) < 10 or score > self.threat_leaderboard[-1].score)
-        nice_eligible = (len(self.nice_leaderboard) < 10 or score < self.nice_leaderboard[-1].score)
-
-        if threat_eligible or nice_eligible:
-            enc_image: str = "data:image/jpeg;base64," + encode(image)
-            identifier: str = f"{time.time()}_{hash(enc_image)}"
-            
-            try:
-                new_score = Score(id=identifier, image=enc_image, name="", score=score)
-            except Exception as e:
-                print(f"Error creating new score: {e}")
-                return last_debounce
-            
-            if threat_eligible:
-                self.threat_leaderboard.append(new_score)
-                self.threat_leaderboard.sort(key=lambda x: x.score, reverse=True)
-                self.threat_leaderboard = self.threat_leaderboard[:5]
-
-            if nice_eligible:
-                self.nice_leaderboard.append(new_score)
-                self.nice_leaderboard.sort(key=lambda x: x.score)
-                self.nice_leaderboard = self.nice_leaderboard[:5]
-            
-            self.save_leaderboard()
-            return time.time()
-        
-        return last_debounce
+            for board, order in ((THREAT, "DESC"), (NICE, "ASC")):
+                rows = connection.execute(
+                    f"SELECT id, name, score, image FROM scores WHERE board = ? ORDER BY score {order} LIMIT ?",
+                    (board, self.size),
+                ).fetchall()
+                for identifier, name, score, image in rows:
+                    self._push(board, ScoreRecord(id=identifier, name=name, score=score, image=image))
+        finally:
+            connection.close()
+
+    def _import_pickles(self, connection: sqlite3.Connection):
+        # One-off migration from the old pickle files
+        for board in (THREAT, NICE):
+            path = f"./{board}_leaderboard.pkl"
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                scores: list[Score] = pickle.load(f)
+            connection.executemany(
+                "INSERT OR REPLACE INTO scores (board, id, name, score, image) VALUES (?, ?, ?, ?, ?)",
+                [(board, s.id, s.name, s.score, base64.b64decode(s.image.split(",", 1)[-1])) for s in scores],
+            )
+        connection.commit()
+
+    def _write(self, connection: sqlite3.Connection, ops: list[tuple]):
+        for op, *args in ops:
+            if op == "insert":
+                board, record = args
+                connection.execute(
+                    "INSERT OR REPLACE INTO scores (board, id, name, score, image) VALUES (?, ?, ?, ?, ?)",
+                    (board, record.id, record.name, record.score, record.image),
+                )
+            elif op == "delete":
+                connection.execute("DELETE FROM scores WHERE board = ? AND id = ?", args)
+            elif op == "rename":
+                connection.execute("UPDATE scores SET name = ? WHERE id = ?", args)
+
+    def _heap(self, board: str) -> list[tuple[float, int, ScoreRecord]]:
+        return self._threat if board == THREAT else self._nice
+
+    def _key(self, board: str, score: float) -> float:
+        return score if board == THREAT else -score
+
+    def _eligible(self, board: str, score: float) -> bool:
+        heap = self._heap(board)
+        return len(heap) < self.size or self._key(board, score) > heap[0][0]
+
+    def cutoffs(self) -> tuple[float, float]:
+        """Scores a new entry has to beat to place on the threat and the nice board."""
+        with self._lock:
+            threat_floor = self._threat[0][0] if len(self._threat) >= self.size else -math.inf
+            nice_ceiling = -self._nice[0][0] if len(self._nice) >= self.size else math.inf
+        return threat_floor, nice_ceiling
+
+    def _push(self, board: str, record: ScoreRecord):
+        heap = self._heap(board)
+        item = (self._key(board, record.score), next(self._counter), record)
+        if len(heap) < self.size:
+            heapq.heappush(heap, item)
+        else:
+            evicted = heapq.heapreplace(heap, item)[2]
+            self._writes.put(("delete", board, evicted.id))
+        self._writes.put(("insert", board, record))
+        self.version += 1
+
+    def _sorted(self, board: str) -> list[Score]:
+        return [record.to_score() for _, _, record in sorted(self._heap(board), reverse=True)]
+
+    @property
+    def threat_leaderboard(self) -> list[Score]:
+        with self._lock:
+            return self._sorted(THREAT)
+
+    @property
+    def nice_leaderboard(self) -> list[Score]:
+        with self._lock:
+            return self._sorted(NICE)
+
+    def snapshot(self) -> tuple[str, list[Score], list[Score]]:
+        """ETag plus both boards, taken consistently."""
+        with self._lock:
+            return f'"{self._started_at}-{self.version}"', self._sorted(NICE), self._sorted(THREAT)
+
+    def get_record(self, identifier: str) -> ScoreRecord | None:
+        with self._lock:
+            for _, _, record in self._threat + self._nice:
+                if record.id == identifier:
+                    return record
+        return None
+
+    def new_score(self, image: EncodedImage, score: float) -> bool:
+        """Put the image on whichever boards its score qualifies for, True if any."""
+        with self._lock:
+            boards = [board for board in (THREAT, NICE) if self._eligible(board, score)]
+        if not boards:
+            return False
+
+        image_bytes = image.jpeg
+        record = ScoreRecord(id=f"{time.time()}_{hash(image_bytes)}", name="", score=score, image=image_bytes)
+
+        with self._lock:
+            for board in boards:
+                # Re-check, another stream may have filled the slot meanwhile
+                if self._eligible(board, score):
+                    self._push(board, record)
+        return True
 
     def update_name(self, identifier: str, name: str) -> bool:
-        for score in self.threat_leaderboard + self.nice_leaderboard:
-            if score.id == identifier:
-                score.name = name
-                self.save_leaderboard()
-                return True
-        return False
+        found = False
+        with self._lock:
+            for _, _, record in self._threat + self._nice:
+                if record.id == identifier:
+                    record.name = name
+                    found = True
+            if found:
+                self.version += 1
+        if found:
+            self._writes.put(("rename", name, identifier))
+        return found
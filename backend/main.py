@@ -1,18 +1,41 @@
 import asyncio
+import os
 from collections import deque
+from contextlib import asynccontextmanager
 import json
+import struct
 
 from fastapi import FastAPI, Response, WebSocket, Request, HTTPException
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from leaderboard_manager import LeaderboardManager
-from common import Detection, Leaderboard, annotation_queue
-from detection_layer import generate_frames
-from decision_layer import call_decision_layer
+from admission import AdmissionController
+from constants import CAMERAS, VERDICT_PAGE_MAX, VERDICT_PAGE_SIZE
+from leaderboard_manager import LeaderboardManager, image_etag
+from broadcast import Broadcaster
+from common import Detection, Leaderboard, VerdictPage
+from detection_queue import annotation_queue
+from detection_process import DetectionProcess
+from frame_hub import mjpeg_stream
+from decision_layer import DecisionAnswer, EscalationLevel
+from decision_service import DecisionService
+from metrics import latest_metrics, register_app_metrics
+from quality_gate import QualityTuner
+from verdict_store import VerdictStore
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models load and warm up in the detection process without holding up startup
+    detection_process.start()
+    decision_service.start()
+    yield
+    await decision_service.stop()
+    await asyncio.to_thread(detection_process.stop)
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class UpdateNameRequest(BaseModel):
@@ -29,31 +52,67 @@ app.add_middleware(
 )
 
 leaderboard_manager: LeaderboardManager = LeaderboardManager()
+default_camera_id: str = next(iter(CAMERAS))
+
+verdicts: Broadcaster[bytes] = Broadcaster()
+verdict_store: VerdictStore = VerdictStore()
+
+
+# Verdicts that get the video around the detection saved with them
+CLIP_LEVELS = {EscalationLevel.CALL_SECURITY, EscalationLevel.ALARM}
+
+
+def verdict_message(verdict_id: int, suspect: Detection, decision: DecisionAnswer, clip: str | None = None) -> bytes:
+    # Binary frame: 4 byte big-endian header length, JSON header, raw JPEG
+    header = json.dumps({
+        "id": verdict_id,
+        "camera_id": suspect.camera_id,
+        "score": suspect.score,
+        "decision": decision.model_dump(mode="json"),
+        "clip": f"/verdicts/{verdict_id}/clip" if clip is not None else None,
+    }).encode("utf-8")
+    return struct.pack(">I", len(header)) + header + suspect.image
+
+
+def publish_verdict(suspect: Detection, decision: DecisionAnswer) -> None:
+    # Every suspect is decided once, the verdict is kept and goes to every dashboard
+    clip = detection_process.record_clip(suspect.camera_id, suspect.created_at) if decision.escalation_level in CLIP_LEVELS else None
+    verdict_id = verdict_store.add(suspect, decision, clip)
+    verdicts.publish(verdict_message(verdict_id, suspect, decision, clip))
+    quality_tuner.observe(suspect.quality, decision.escalation_level == EscalationLevel.NOT_READABLE)
+
+
+decision_service: DecisionService = DecisionService(annotation_queue, publish_verdict)
+admission: AdmissionController = AdmissionController(annotation_queue, decision_service)
+detection_process: DetectionProcess = DetectionProcess(CAMERAS, leaderboard_manager, annotation_queue, admission.threshold)
+quality_tuner: QualityTuner = QualityTuner(detection_process.quality_thresholds)
+
+
+def stream_stats() -> dict[str, dict]:
+    pipelines = detection_process.stats().get("streams", {})
+    return {
+        camera_id: {**pipelines.get(camera_id, {}), "viewers": hub.subscriber_count}
+        for camera_id, hub in detection_process.hubs.items()
+    }
+
+
+register_app_metrics(
+    stream_stats,
+    lambda: len(annotation_queue),
+    lambda: sum(1 for hub in detection_process.hubs.values() if hub.running),
+    lambda: verdicts.subscriber_count,
+    admission.threshold,
+)
+
 
 @app.websocket("/ws/verdicts")
 async def verdicts_websocket(websocket: WebSocket) -> None:
     await websocket.accept()
 
     try:
-        while True:
-            if not annotation_queue:
-                await asyncio.sleep(0.1)
-                continue
-
-            suspect: Detection = annotation_queue.pop(0)
-
-            decision = await call_decision_layer(suspect.image)
-            
-            # Handle errors "gracefully"
-            if decision is None:
-                continue
-
-            message = {
-                "image": f"data:image/jpeg;base64,{suspect.image}",
-                "decision": decision.model_dump_json()
-            }
-            await websocket.send_text(json.dumps(message))
-    
+        async for message in verdicts.subscribe():
+            await websocket.send_bytes(message)
+
     except Exception as e:
         print(f"Socket Error: {e}")
     finally:
@@ -62,16 +121,113 @@ async def verdicts_websocket(websocket: WebSocket) -> None:
 
 @app.get("/video_feed")
 async def video_feed() -> StreamingResponse:
-    # Generate an MJPEG stream
-    return StreamingResponse(generate_frames(leaderboard_manager), media_type="multipart/x-mixed-replace; boundary=frame")
+    return await camera_feed(default_camera_id)
+
+
+@app.get("/video_feed/{camera_id}")
+async def camera_feed(camera_id: str) -> StreamingResponse:
+    if camera_id not in detection_process.hubs:
+        raise HTTPException(status_code=404, detail=f"Unknown camera {camera_id}.")
+
+    # Every viewer of a camera attaches to the same detection pipeline
+    return StreamingResponse(mjpeg_stream(detection_process.hubs[camera_id]), media_type="multipart/x-mixed-replace; boundary=frame")
+
+
+@app.get("/ready")
+async def readiness() -> JSONResponse:
+    # Ready is only ever set once, a detection process that died since is not ready
+    if not (detection_process.ready.is_set() and detection_process.alive):
+        return JSONResponse({"ready": False}, status_code=503)
+    return JSONResponse({"ready": True})
+
+
+@app.get("/stats")
+async def stats() -> dict:
+    return {
+        "detection_process": {"alive": detection_process.alive},
+        "inference": detection_process.stats().get("inference", {}),
+        "annotation_queue": {
+            "depth": len(annotation_queue),
+            "evicted": annotation_queue.evicted,
+            "expired": annotation_queue.expired,
+        },
+        "decisions": decision_service.stats(),
+        "admission": admission.stats(),
+        "quality": quality_tuner.stats(),
+        "verdict_subscribers": verdicts.subscriber_count,
+        "streams": stream_stats(),
+    }
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    content, media_type = latest_metrics()
+    return Response(content=content, media_type=media_type)
+
+
+@app.get("/verdicts", response_model=VerdictPage)
+async def verdict_history(
+    since: float | None = None,
+    until: float | None = None,
+    level: EscalationLevel | None = None,
+    camera_id: str | None = None,
+    cursor: int | None = None,
+    limit: int = VERDICT_PAGE_SIZE,
+) -> VerdictPage:
+    # Newest first, pass next_cursor back as cursor for older ones
+    limit = max(1, min(limit, VERDICT_PAGE_MAX))
+    return await asyncio.to_thread(verdict_store.query, since, until, level, camera_id, cursor, limit)
+
+
+@app.get("/verdicts/{verdict_id}/image")
+async def verdict_image(verdict_id: int, request: Request) -> Response:
+    data = await asyncio.to_thread(verdict_store.get_image, verdict_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Unknown verdict.")
+
+    headers = {"ETag": image_etag(data), "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+
+@app.get("/verdicts/{verdict_id}/clip")
+async def verdict_clip(verdict_id: int) -> FileResponse:
+    path = await asyncio.to_thread(verdict_store.get_clip, verdict_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No clip for this verdict.")
+    # The clip is written once the frames after the detection are in
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Clip not saved yet.")
+
+    # Motion JPEG, the annotated frames exactly as they were streamed
+    return FileResponse(path, media_type="video/x-motion-jpeg", filename=os.path.basename(path))
 
 
 @app.get("/leaderboard", response_model=Leaderboard)
-async def leaderboard() -> Leaderboard:
-    return Leaderboard(
-        nice=leaderboard_manager.nice_leaderboard,
-        threat=leaderboard_manager.threat_leaderboard
-    )
+async def leaderboard(request: Request, response: Response):
+    etag, nice, threat = leaderboard_manager.snapshot()
+    # Clients revalidate every poll, unchanged boards cost a 304
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return Leaderboard(nice=nice, threat=threat)
+
+
+@app.get("/images/{image_id}")
+async def image(image_id: str, request: Request, thumbnail: bool = False) -> Response:
+    record = leaderboard_manager.get_record(image_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Unknown image.")
+
+    data = record.get_thumbnail() if thumbnail else record.image
+    # Images never change once stored, so clients can keep them forever
+    headers = {"ETag": image_etag(data), "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
 
 
 @app.post("/update-name")
@@ -83,5 +239,10 @@ async def update_name(request: UpdateNameRequest) -> Response:
     return Response(status_code=200)
 
 if __name__ == "__main__":
-    for e in generate_frames(leaderboard_manager):
+    # Runs the default camera's pipeline in this process, without the API
+    from inference_scheduler import InferenceScheduler
+    from streams import CameraStream
+
+    stream = CameraStream(default_camera_id, CAMERAS[default_camera_id], leaderboard_manager, annotation_queue, InferenceScheduler())
+    for e in stream.frames():
         pass
@@ -0,0 +1,85 @@
+import atexit
+import os
+import shutil
+import tempfile
+from typing import Callable, Iterable
+
+# Counters and histograms are shared with the detection process through files in
+# this directory, which has to be chosen before prometheus_client is imported
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="security-bot-metrics-")
+    atexit.register(shutil.rmtree, os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from prometheus_client.registry import Collector
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+stage_seconds = Histogram("security_bot_stage_seconds", "Time spent per pipeline stage", ["stage"], buckets=STAGE_BUCKETS)
+# Bound once so the hot path doesn't look labels up on every frame
+yolo_seconds = stage_seconds.labels(stage="yolo")
+preprocess_seconds = stage_seconds.labels(stage="preprocess")
+clip_seconds = stage_seconds.labels(stage="clip")
+encode_seconds = stage_seconds.labels(stage="encode")
+llm_seconds = stage_seconds.labels(stage="llm")
+
+debounced_detections = Counter("security_bot_debounced_detections", "Suspects dropped because the debounce window was active")
+llm_errors = Counter("security_bot_llm_errors", "Failed decision layer calls", ["kind"])
+verdicts = Counter("security_bot_verdicts", "Verdicts produced", ["escalation_level"])
+quality_rejections = Counter("security_bot_quality_rejections", "Person crops failing the quality gate", ["reason"])
+
+registry = CollectorRegistry()
+MultiProcessCollector(registry)
+
+
+class AppCollector(Collector):
+    """Reads the state the API process already keeps, only when scraped."""
+
+    def __init__(
+        self,
+        stream_stats: Callable[[], dict[str, dict]],
+        queue_depth: Callable[[], float],
+        active_streams: Callable[[], float],
+        websocket_subscribers: Callable[[], float],
+        z_cutoff: Callable[[], float],
+    ):
+        self.stream_stats = stream_stats
+        self.queue_depth = queue_depth
+        self.active_streams = active_streams
+        self.websocket_subscribers = websocket_subscribers
+        self.z_cutoff = z_cutoff
+
+    def collect(self) -> Iterable:
+        dropped = CounterMetricFamily("security_bot_dropped_frames", "Frames overwritten before inference read them", labels=["camera"])
+        stale = CounterMetricFamily("security_bot_stale_frames", "Frames older than MAX_FRAME_AGE when inferred", labels=["camera"])
+        latency = GaugeMetricFamily("security_bot_glass_to_verdict_seconds", "Capture to scored latency of the last frame", labels=["camera"])
+        viewers = GaugeMetricFamily("security_bot_stream_viewers", "MJPEG viewers attached", labels=["camera"])
+        for camera_id, stats in self.stream_stats().items():
+            viewers.add_metric([camera_id], stats["viewers"])
+            # Capture stats arrive from the detection process once it has started the camera
+            if "capture" in stats:
+                dropped.add_metric([camera_id], stats["capture"]["dropped"])
+                stale.add_metric([camera_id], stats["capture"]["stale"])
+                latency.add_metric([camera_id], stats["capture"]["latency"])
+        yield from (dropped, stale, latency, viewers)
+
+        yield GaugeMetricFamily("security_bot_annotation_queue_depth", "Detections waiting for the decision layer", value=self.queue_depth())
+        yield GaugeMetricFamily("security_bot_active_streams", "Streams with a running pipeline", value=self.active_streams())
+        yield GaugeMetricFamily("security_bot_websocket_subscribers", "Connected verdict WebSockets", value=self.websocket_subscribers())
+        yield GaugeMetricFamily("security_bot_admission_z_cutoff", "Z-score a suspect currently needs to reach the decision layer", value=self.z_cutoff())
+
+
+def register_app_metrics(
+    stream_stats: Callable[[], dict[str, dict]],
+    queue_depth: Callable[[], float],
+    active_streams: Callable[[], float],
+    websocket_subscribers: Callable[[], float],
+    z_cutoff: Callable[[], float],
+):
+    registry.register(AppCollector(stream_stats, queue_depth, active_streams, websocket_subscribers, z_cutoff))
+
+
+def latest_metrics() -> tuple[bytes, str]:
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,68 @@
+import time
+
+import cv2
+import numpy as np
+
+from constants import (INFERENCE_THROTTLE, MOTION_IDLE_INTERVAL, MOTION_MIN_AREA, MOTION_PIXEL_THRESHOLD,
+                       MOTION_WIDTH)
+
+
+class MotionGate:
+    """
+    Decides per frame whether detection needs to run. Static scenes, judged by
+    differencing downscaled greyscale frames, only get re-checked every
+    MOTION_IDLE_INTERVAL seconds. When inference takes longer than the camera
+    needs to deliver a frame, inferences are spaced out so the stream keeps
+    its frame rate and leaves room on the accelerator for other cameras.
+    Frames that are not inferred are drawn with the last detections.
+    """
+
+    def __init__(self):
+        self._previous: np.ndarray | None = None
+        self._last_inference = 0.0
+        self._inference_time = 0.0  # EMA of seconds per inference
+
+        self.frames = 0
+        self.inferred = 0
+        self.with_people = 0
+        self._started_at = time.time()
+
+    def has_motion(self, frame: np.ndarray) -> bool:
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (MOTION_WIDTH, max(1, height * MOTION_WIDTH // width)), interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        previous, self._previous = self._previous, small
+        if previous is None or previous.shape != small.shape:
+            return True
+
+        changed = np.count_nonzero(cv2.absdiff(previous, small) > MOTION_PIXEL_THRESHOLD)
+        return changed >= MOTION_MIN_AREA * small.size
+
+    def should_infer(self, frame: np.ndarray, capture_interval: float) -> bool:
+        self.frames += 1
+        now = time.time()
+        since_last = now - self._last_inference
+
+        # Falling behind the camera, back off
+        if self._inference_time > capture_interval > 0 and since_last < self._inference_time * INFERENCE_THROTTLE:
+            return False
+
+        return self.has_motion(frame) or since_last > MOTION_IDLE_INTERVAL
+
+    def record_inference(self, started_at: float, people: int):
+        duration = time.time() - started_at
+        self._inference_time = duration if self.inferred == 0 else 0.9 * self._inference_time + 0.1 * duration
+        self._last_inference = started_at
+        self.inferred += 1
+        if people > 0:
+            self.with_people += 1
+
+    def stats(self) -> dict:
+        elapsed = max(time.time() - self._started_at, 1e-6)
+        return {
+            "fps": self.frames / elapsed,
+            "inference_fps": self.inferred / elapsed,
+            "detection_rate": self.with_people / self.inferred if self.inferred else 0.0,
+            "skip_ratio": 1 - self.inferred / self.frames if self.frames else 0.0,
+        }
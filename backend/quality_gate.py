@@ -0,0 +1,143 @@
+from typing import MutableSequence
+
+import cv2
+import numpy as np
+
+from constants import (QUALITY_EDGE_ASPECT, QUALITY_EDGE_MARGIN, QUALITY_LEARNING_MARGIN, QUALITY_LEARNING_RATE,
+                       QUALITY_MAX_BRIGHTNESS, QUALITY_MAX_RAISE, QUALITY_MIN_BRIGHTNESS, QUALITY_MIN_HEIGHT,
+                       QUALITY_MIN_SHARPNESS)
+from metrics import quality_rejections
+
+# Thresholds the tuner learns, in the order crops report their measurements
+LEARNED_THRESHOLDS = ("min_height", "min_sharpness", "min_brightness")
+DEFAULT_THRESHOLDS = (QUALITY_MIN_HEIGHT, QUALITY_MIN_SHARPNESS, QUALITY_MIN_BRIGHTNESS)
+
+
+class QualityGate:
+    """
+    Cheap checks on every person box before it costs a CLIP pass or an LLM
+    call: too small, blurred, badly exposed, or cut off by the frame border.
+    The geometric checks run on all boxes of a frame at once, only boxes that
+    pass them have their pixels measured, each at a cost of its own area.
+    """
+
+    def __init__(
+        self,
+        thresholds: MutableSequence[float] | None = None,
+        max_brightness: float = QUALITY_MAX_BRIGHTNESS,
+        edge_margin: int = QUALITY_EDGE_MARGIN,
+        edge_aspect: tuple[float, float] = QUALITY_EDGE_ASPECT,
+    ):
+        # Shared with a QualityTuner in the API process when running detection there
+        self.thresholds = thresholds if thresholds is not None else list(DEFAULT_THRESHOLDS)
+        self.max_brightness = max_brightness
+        self.edge_margin = edge_margin
+        self.edge_aspect = edge_aspect
+
+        self.checked = 0
+        self.rejected = {"size": 0, "sharpness": 0, "exposure": 0, "occlusion": 0}
+
+    def check(self, frame: np.ndarray, boxes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Which xyxy boxes are worth looking at, and the height, sharpness and
+        brightness measured for each.
+        """
+        if len(boxes) == 0:
+            return np.zeros(0, dtype=bool), np.zeros((0, 3))
+
+        frame_height, frame_width = frame.shape[:2]
+        x1, y1, x2, y2 = np.round(boxes[:, :4]).astype(np.int64).T
+        x1 = np.clip(x1, 0, frame_width - 1)
+        y1 = np.clip(y1, 0, frame_height - 1)
+        x2 = np.clip(x2, x1 + 1, frame_width)
+        y2 = np.clip(y2, y1 + 1, frame_height)
+        width, height = x2 - x1, y2 - y1
+        min_height, min_sharpness, min_brightness = self.thresholds[:]
+
+        # A person touching the border with an unlikely shape is probably only partly in view
+        margin = self.edge_margin
+        at_edge = (x1 <= margin) | (y1 <= margin) | (x2 >= frame_width - margin) | (y2 >= frame_height - margin)
+        aspect = height / width
+        min_aspect, max_aspect = self.edge_aspect
+
+        failures = {
+            "size": height < min_height,
+            "occlusion": at_edge & ((aspect < min_aspect) | (aspect > max_aspect)),
+        }
+
+        # Blur and exposure only for boxes the cheap checks kept
+        measured = ~(failures["size"] | failures["occlusion"])
+        sharpness = np.zeros(len(boxes))
+        brightness = np.zeros(len(boxes))
+        for i in np.flatnonzero(measured):
+            crop = frame[y1[i]:y2[i], x1[i]:x2[i]]
+            grey = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+            brightness[i] = cv2.mean(grey)[0]
+            sharpness[i] = cv2.meanStdDev(cv2.Laplacian(grey, cv2.CV_16S))[1][0, 0] ** 2
+        failures["sharpness"] = measured & (sharpness < min_sharpness)
+        failures["exposure"] = measured & ((brightness < min_brightness) | (brightness > self.max_brightness))
+        usable = ~np.logical_or.reduce(list(failures.values()))
+
+        self.checked += len(boxes)
+        for reason, failed in failures.items():
+            count = int(failed.sum())
+            if count:
+                self.rejected[reason] += count
+                quality_rejections.labels(reason).inc(count)
+
+        return usable, np.stack([height, sharpness, brightness], axis=1).astype(np.float64)
+
+    def stats(self) -> dict:
+        return {
+            "checked": self.checked,
+            "rejected": dict(self.rejected),
+            "thresholds": dict(zip(LEARNED_THRESHOLDS, self.thresholds[:])),
+        }
+
+
+class QualityTuner:
+    """
+    Tightens the quality gate from the decision layer's verdicts. A crop that
+    came back NOT_READABLE while only just passing a check pulls that check up
+    past it, readable crops near a threshold ease it back towards the
+    configured value. Learned thresholds stay between the configured value and
+    QUALITY_MAX_RAISE times it.
+    """
+
+    def __init__(
+        self,
+        thresholds: MutableSequence[float],
+        base: tuple[float, ...] = DEFAULT_THRESHOLDS,
+        rate: float = QUALITY_LEARNING_RATE,
+        margin: float = QUALITY_LEARNING_MARGIN,
+        max_raise: float = QUALITY_MAX_RAISE,
+    ):
+        self.thresholds = thresholds
+        self.base = base
+        self.rate = rate
+        self.margin = margin
+        self.max_raise = max_raise
+
+        self.unreadable = 0
+
+    def observe(self, quality: list[float] | None, unreadable: bool):
+        if quality is None:
+            return
+
+        self.unreadable += unreadable
+        for i, (value, base) in enumerate(zip(quality, self.base)):
+            threshold = self.thresholds[i]
+            # Crops well clear of a threshold say nothing about where it belongs
+            if value > threshold * self.margin:
+                continue
+            if unreadable:
+                threshold += self.rate * (value * self.margin - threshold)
+            else:
+                threshold -= self.rate * (threshold - base)
+            self.thresholds[i] = min(base * self.max_raise, max(base, threshold))
+
+    def stats(self) -> dict:
+        return {
+            "unreadable": self.unreadable,
+            "thresholds": dict(zip(LEARNED_THRESHOLDS, self.thresholds[:])),
+        }
@@ -0,0 +1,69 @@
+from typing import TYPE_CHECKING, Callable, Iterator
+
+from admission import TrackDebounce
+from capture import FrameGrabber
+from constants import Z_CUTOFF
+from detection_layer import generate_frames
+from detection_queue import DetectionQueue
+from event_clips import ClipBuffer
+from frame_sources import open_source
+from inference_scheduler import InferenceScheduler
+from leaderboard_manager import LeaderboardManager
+from motion_gate import MotionGate
+from threat_stats import ThreatStats
+from tracker import IoUTracker
+
+if TYPE_CHECKING:
+    from detection_process import PipelineEvents
+
+
+class CameraStream:
+    """One frame source with its own capture thread and detection pipeline."""
+
+    def __init__(
+        self,
+        camera_id: str,
+        settings: dict,
+        leaderboard_manager: "LeaderboardManager | PipelineEvents",
+        annotations: "DetectionQueue | PipelineEvents",
+        scheduler: InferenceScheduler,
+        z_cutoff: Callable[[], float] = lambda: Z_CUTOFF,
+    ):
+        self.camera_id = camera_id
+        self.settings = settings
+        self.grabber = FrameGrabber(lambda: open_source(settings))
+        self.tracker = IoUTracker()
+        self.threat_stats = ThreatStats(camera_id)
+        self.motion_gate = MotionGate()
+        self.debouncer = TrackDebounce()
+        self.clips = ClipBuffer()
+        self.leaderboard_manager = leaderboard_manager
+        self.annotations = annotations
+        self.scheduler = scheduler
+        self.z_cutoff = z_cutoff
+
+    def frames(self) -> Iterator[bytes]:
+        return generate_frames(self)
+
+    def stats(self) -> dict:
+        return {
+            "capture": self.grabber.stats(),
+            "inference": self.motion_gate.stats(),
+            "tracking": self.tracker.stats(),
+            "admission": self.debouncer.stats(),
+            "threat_baseline": self.threat_stats.stats(),
+            "clip_buffer": self.clips.stats(),
+        }
+
+
+def create_streams(
+    cameras: dict[str, dict],
+    leaderboard_manager: "LeaderboardManager | PipelineEvents",
+    annotations: "DetectionQueue | PipelineEvents",
+    scheduler: InferenceScheduler,
+    z_cutoff: Callable[[], float] = lambda: Z_CUTOFF,
+) -> dict[str, CameraStream]:
+    return {
+        camera_id: CameraStream(camera_id, settings, leaderboard_manager, annotations, scheduler, z_cutoff)
+        for camera_id, settings in cameras.items()
+    }
@@ -0,0 +1,99 @@
+"""
+Checks how many requests a batch of suspects turns into against a local mock
+provider: a batch answer that can't be parsed falls back to one request per
+crop, a provider that is down gets no more than the batch itself.
+
+    python test_batch_fallback.py
+"""
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import instructor
+from openai import AsyncOpenAI
+
+import decision_layer
+from common import Detection
+from decision_layer import DecisionAnswer, EscalationLevel
+from decision_service import DecisionService
+from detection_queue import DetectionQueue
+
+CROPS = 4
+
+
+def start_mock_provider(mode: str) -> tuple[str, dict]:
+    """Serve chat completions on localhost, returns the base URL and request counts."""
+    counts = {"batch": 0, "single": 0}
+    answer = DecisionAnswer(
+        higher_level_reasoning="Test run.",
+        escalation_level=EscalationLevel.LOG,
+        escalation_reason="Mock answer.",
+    ).model_dump_json()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+            kind = "batch" if "Image 1:" in request else "single"
+            counts[kind] += 1
+
+            if mode == "down":
+                self.send_response(500)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b'{"error": {"message": "Provider down"}}')
+                return
+
+            content = "Not JSON at all" if kind == "batch" else answer
+            body = json.dumps({
+                "id": "mock",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "mock",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1", counts
+
+
+def run_batch(mode: str) -> tuple[DecisionService, dict]:
+    url, counts = start_mock_provider(mode)
+    decision_layer.client = instructor.from_openai(AsyncOpenAI(base_url=url, api_key="test", max_retries=0), mode=instructor.Mode.JSON)
+
+    async def decide() -> DecisionService:
+        service = DecisionService(DetectionQueue(), lambda suspect, decision: None, retries=0)
+        await service._decide_batch([Detection(image=b"crop", score=6.0) for _ in range(CROPS)])
+        return service
+
+    return asyncio.run(decide()), counts
+
+
+def test_unparsed_batch_falls_back_per_crop():
+    service, counts = run_batch("unparsed")
+    assert service.batch_fallbacks == CROPS, service.stats()
+    assert service.verdicts == CROPS, service.stats()
+    assert counts["single"] == CROPS, counts
+
+
+def test_failed_batch_is_not_fanned_out():
+    service, counts = run_batch("down")
+    assert service.batch_fallbacks == 0, service.stats()
+    assert service.failed == 1, service.stats()
+    assert counts["single"] == 0, counts
+
+
+if __name__ == "__main__":
+    test_unparsed_batch_falls_back_per_crop()
+    test_failed_batch_is_not_fanned_out()
+    print("Batch fallback checks passed")
@@ -1,8 +1,14 @@
+import sys
+
 import cv2
 
-camera = cv2.VideoCapture(0)  # Open the default webcam
+from constants import CAMERAS
+from frame_sources import open_source
+
+camera_id = sys.argv[1] if len(sys.argv) > 1 else "default"
+camera = open_source(CAMERAS[camera_id])
 if not camera.isOpened():
-    print("Error: Could not access the webcam.")
+    print(f"Error: Could not open camera {camera_id}.")
     exit()
 
 while True:
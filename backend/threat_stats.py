@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import time
+
+import torch
+from torch import Tensor
+
+from constants import SIM_ALPHA, SIM_MEAN, SIM_VAR, THREAT_STATS_FILE, THREAT_STATS_SAVE_INTERVAL
+
+_file_lock = threading.Lock()
+
+
+class ThreatStats:
+    """
+    Running EMA mean and variance of one camera's threat similarities, used
+    to turn similarities into z-scores. The state is saved periodically and
+    reloaded on start, so the baseline survives deploys.
+    """
+
+    def __init__(self, camera_id: str, path: str = THREAT_STATS_FILE, alpha: float = SIM_ALPHA):
+        self.camera_id = camera_id
+        self.path = path
+        self.alpha = alpha
+
+        self.running_mean = SIM_MEAN
+        self.running_var = SIM_VAR
+        self.n = 0
+        self._saved_at = time.time()
+        self.load()
+
+    def update(self, similarities: Tensor) -> tuple[list[float], list[float]]:
+        """
+        Fold a batch of similarities into the EMA in one vectorised step and
+        return each one's z-score. Equivalent to updating one similarity at a
+        time: person k is scored against the statistics including persons 1..k.
+        """
+        # The only host transfer for the batch, the rest runs in float64 on the CPU
+        x = similarities.detach().to("cpu", torch.float64)
+        k = torch.arange(1, len(x) + 1, dtype=torch.float64)
+        decay = (1 - self.alpha) ** k  # (1 - a)^k
+        inverse = (1 - self.alpha) ** -k  # (1 - a)^-k
+
+        # m_k = (1-a)^k * (m_0 + a * sum_{i<=k} (1-a)^-i * x_i)
+        means = decay * (self.running_mean + self.alpha * torch.cumsum(inverse * x, dim=0))
+        # v_k = (1-a)^k * (v_0 + a * sum_{i<=k} (1-a)^-i * (x_i - m_i)^2)
+        variances = decay * (self.running_var + self.alpha * torch.cumsum(inverse * (x - means) ** 2, dim=0))
+
+        std_devs = torch.where(variances > 0, variances.clamp(min=0).sqrt(), torch.ones_like(variances))
+        z_scores = (x - means) / std_devs
+
+        self.running_mean = float(means[-1])
+        self.running_var = float(variances[-1])
+        self.n += len(x)
+
+        if time.time() - self._saved_at > THREAT_STATS_SAVE_INTERVAL:
+            self.save()
+        return z_scores.tolist(), x.tolist()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f).get(self.camera_id)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if state is not None:
+            self.running_mean = state["running_mean"]
+            self.running_var = state["running_var"]
+            self.n = state["n"]
+
+    def save(self):
+        self._saved_at = time.time()
+        # Cameras share one file, so read-modify-write under a lock and swap atomically
+        with _file_lock:
+            try:
+                with open(self.path, "r") as f:
+                    states = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                states = {}
+            states[self.camera_id] = self.stats()
+
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(states, f)
+            os.replace(temp_path, self.path)
+
+    def stats(self) -> dict:
+        return {
+            "running_mean": self.running_mean,
+            "running_var": self.running_var,
+            "n": self.n,
+        }
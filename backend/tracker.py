@@ -0,0 +1,99 @@
+import numpy as np
+from torch import Tensor
+
+from constants import TRACK_IOU, TRACK_MAX_MISSES, TRACK_REEMBED_IOU, TRACK_REFRESH
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between N x 4 and M x 4 xyxy boxes."""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-6)
+
+
+class Track:
+    def __init__(self, track_id: int, box: np.ndarray):
+        self.id = track_id
+        self.box = box
+        self.misses = 0
+
+        # CLIP embedding cache for this person
+        self.features: Tensor | None = None
+        self.embedded_box = box
+        self.embedded_at = 0.0
+
+    def needs_embedding(self, now: float) -> bool:
+        if self.features is None or now - self.embedded_at > TRACK_REFRESH:
+            return True
+        return box_iou(self.box[None], self.embedded_box[None])[0, 0] < TRACK_REEMBED_IOU
+
+    def set_features(self, features: Tensor, now: float):
+        self.features = features
+        self.embedded_box = self.box
+        self.embedded_at = now
+
+
+class IoUTracker:
+    """
+    SORT-style tracker that greedily matches detections to live tracks by IoU.
+    Tracks carry a CLIP embedding cache so people who stay put are not
+    re-embedded on every frame; the cache goes away with the track.
+    """
+
+    def __init__(self, iou_threshold: float = TRACK_IOU, max_misses: int = TRACK_MAX_MISSES):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks: dict[int, Track] = {}
+        self._next_id = 1
+
+        self.embedded = 0
+        self.reused = 0
+
+    def update(self, boxes: np.ndarray) -> list[Track]:
+        """Assign a track to every box, in the order of the boxes."""
+        track_list = list(self.tracks.values())
+        assigned: list[Track | None] = [None] * len(boxes)
+        matched: set[int] = set()
+
+        if len(track_list) > 0 and len(boxes) > 0:
+            ious = box_iou(boxes, np.stack([track.box for track in track_list]))
+            # Greedy matching, best overlaps first
+            for flat in np.argsort(-ious, axis=None):
+                box_idx, track_idx = np.unravel_index(flat, ious.shape)
+                if ious[box_idx, track_idx] < self.iou_threshold:
+                    break
+                track = track_list[track_idx]
+                if assigned[box_idx] is not None or track.id in matched:
+                    continue
+                assigned[box_idx] = track
+                matched.add(track.id)
+                track.box = boxes[box_idx]
+                track.misses = 0
+
+        for i, track in enumerate(assigned):
+            if track is None:
+                track = Track(self._next_id, boxes[i])
+                self._next_id += 1
+                self.tracks[track.id] = track
+                matched.add(track.id)
+                assigned[i] = track
+
+        # Forget tracks that have been gone too long, and their cached embeddings
+        for track_id, track in list(self.tracks.items()):
+            if track_id in matched:
+                continue
+            track.misses += 1
+            if track.misses > self.max_misses:
+                del self.tracks[track_id]
+
+        return assigned  # type: ignore
+
+    def stats(self) -> dict:
+        return {
+            "tracks": len(self.tracks),
+            "embedded": self.embedded,
+            "reused": self.reused,
+        }
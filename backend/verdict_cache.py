@@ -0,0 +1,96 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from constants import ADMISSION_ESCALATION, VERDICT_CACHE_SIMILARITY, VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL
+from decision_layer import DecisionAnswer, EscalationLevel
+
+
+class VerdictCache:
+    """
+    Remembers recent verdicts by the CLIP embedding of the crop that earned
+    them. A new crop whose embedding is close enough to a cached one reuses
+    that verdict instead of paying for another LLM call, unless its z-score
+    has climbed well past the one the verdict was given for. Least recently
+    used entries are evicted once the cache is full.
+    """
+
+    def __init__(
+        self,
+        threshold: float = VERDICT_CACHE_SIMILARITY,
+        ttl: float = VERDICT_CACHE_TTL,
+        maxsize: int = VERDICT_CACHE_SIZE,
+        escalation: float = ADMISSION_ESCALATION,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.escalation = escalation
+
+        self._entries: OrderedDict[int, tuple[np.ndarray, DecisionAnswer, float, float]] = OrderedDict()  # embedding, verdict, time, z-score
+        self._next_key = 0
+        self._keys: list[int] = []
+        self._matrix: np.ndarray | None = None  # Stacked embeddings, rebuilt when entries change
+
+        self.hits = 0
+        self.misses = 0
+        self.escalated = 0  # Close enough, but a lot more suspicious than when decided
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expire(self):
+        deadline = time.time() - self.ttl
+        expired = [key for key, (_, _, created_at, _) in self._entries.items() if created_at < deadline]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def lookup(self, embedding: list[float], score: float) -> DecisionAnswer | None:
+        self._expire()
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        if self._matrix is None:
+            self._keys = list(self._entries.keys())
+            self._matrix = np.stack([entry[0] for entry in self._entries.values()])
+
+        # Embeddings are normalised, so the dot product is the cosine similarity
+        similarities = self._matrix @ np.asarray(embedding, dtype=np.float32)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        key = self._keys[best]
+        # The same person looking a lot more threatening deserves a fresh look
+        if score >= self._entries[key][3] + self.escalation:
+            self.escalated += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key][1]
+
+    def add(self, embedding: list[float], decision: DecisionAnswer, score: float):
+        # A blurry crop says nothing about the person, so don't let it stick
+        if decision.escalation_level == EscalationLevel.NOT_READABLE:
+            return
+
+        self._entries[self._next_key] = (np.asarray(embedding, dtype=np.float32), decision, time.time(), score)
+        self._next_key += 1
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "escalated": self.escalated,
+        }
@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import threading
+import time
+
+from batched_writer import BatchedWriter
+from common import Detection, Verdict, VerdictPage
+from constants import CLIP_DIR, VERDICT_DB, VERDICT_PAGE_SIZE, VERDICT_RETENTION
+from decision_layer import DecisionAnswer, EscalationLevel
+
+
+class VerdictStore:
+    """
+    History of every verdict with its crop, in SQLite. Verdicts get their id
+    straight away and are written from a background thread, grouped into one
+    transaction per burst, so publishing a verdict never waits on disk.
+    Queries page backwards through the history by id. Escalations also
+    reference a clip file in clip_dir, which is pruned along with them.
+    """
+
+    def __init__(self, db_path: str = VERDICT_DB, retention: float = VERDICT_RETENTION, clip_dir: str = CLIP_DIR):
+        self.db_path = db_path
+        self.retention = retention
+        self.clip_dir = clip_dir
+
+        self._next_id = self.init_db() + 1
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+
+        self._writes = BatchedWriter(self._connect, self._write, "verdicts")
+        self._writes.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def init_db(self) -> int:
+        """Create the schema if needed, returns the highest id stored so far."""
+        connection = self._connect()
+        try:
+            # WAL lets the API read while the writer thread inserts
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                " id INTEGER PRIMARY KEY, camera_id TEXT, score REAL NOT NULL,"
+                " created_at REAL NOT NULL, decided_at REAL NOT NULL,"
+                " higher_level_reasoning TEXT NOT NULL, escalation_level TEXT NOT NULL, escalation_reason TEXT NOT NULL,"
+                " image BLOB NOT NULL, clip TEXT)"
+            )
+            # Histories from before clips were recorded
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(verdicts)")}
+            if "clip" not in columns:
+                connection.execute("ALTER TABLE verdicts ADD COLUMN clip TEXT")
+            connection.execute("CREATE INDEX IF NOT EXISTS verdicts_by_time ON verdicts (decided_at)")
+            connection.execute("CREATE INDEX IF NOT EXISTS verdicts_by_level ON verdicts (escalation_level, id)")
+            connection.execute("CREATE INDEX IF NOT EXISTS verdicts_by_camera ON verdicts (camera_id, id)")
+            return connection.execute("SELECT MAX(id) FROM verdicts").fetchone()[0] or 0
+        finally:
+            connection.close()
+
+    def add(self, suspect: Detection, decision: DecisionAnswer, clip: str | None = None) -> int:
+        with self._lock:
+            verdict_id = self._next_id
+            self._next_id += 1
+        self._writes.put((
+            verdict_id, suspect.camera_id, suspect.score, suspect.created_at, time.time(),
+            decision.higher_level_reasoning, decision.escalation_level.value, decision.escalation_reason,
+            suspect.image, clip,
+        ))
+        return verdict_id
+
+    def _write(self, connection: sqlite3.Connection, rows: list[tuple]):
+        connection.executemany(
+            "INSERT INTO verdicts (id, camera_id, score, created_at, decided_at, higher_level_reasoning,"
+            " escalation_level, escalation_reason, image, clip) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        # Hourly is plenty for a retention measured in days
+        if time.time() - self._pruned_at > 3600:
+            self._prune(connection, time.time() - self.retention)
+            self._pruned_at = time.time()
+
+    def _prune(self, connection: sqlite3.Connection, before: float):
+        clips = connection.execute("SELECT clip FROM verdicts WHERE decided_at < ? AND clip IS NOT NULL", (before,)).fetchall()
+        connection.execute("DELETE FROM verdicts WHERE decided_at < ?", (before,))
+        for (clip,) in clips:
+            try:
+                os.remove(os.path.join(self.clip_dir, clip))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error removing clip {clip}: {e}")
+
+    def query(
+        self,
+        since: float | None = None,
+        until: float | None = None,
+        level: EscalationLevel | None = None,
+        camera_id: str | None = None,
+        cursor: int | None = None,
+        limit: int = VERDICT_PAGE_SIZE,
+    ) -> VerdictPage:
+        conditions, params = [], []
+        for condition, value in (
+            ("decided_at >= ?", since),
+            ("decided_at < ?", until),
+            ("escalation_level = ?", level.value if level is not None else None),
+            ("camera_id = ?", camera_id),
+            ("id < ?", cursor),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        connection = self._connect()
+        try:
+            # One extra row tells whether there is another page
+            rows = connection.execute(
+                "SELECT id, camera_id, score, created_at, decided_at, higher_level_reasoning, escalation_level, escalation_reason, clip"
+                f" FROM verdicts {where} ORDER BY id DESC LIMIT ?",
+                (*params, limit + 1),
+            ).fetchall()
+        finally:
+            connection.close()
+
+        verdicts = [
+            Verdict(
+                id=row[0], camera_id=row[1], score=row[2], created_at=row[3], decided_at=row[4],
+                higher_level_reasoning=row[5], escalation_level=row[6], escalation_reason=row[7],
+                image=f"/verdicts/{row[0]}/image",
+                clip=f"/verdicts/{row[0]}/clip" if row[8] is not None else None,
+            )
+            for row in rows[:limit]
+        ]
+        return VerdictPage(verdicts=verdicts, next_cursor=verdicts[-1].id if len(rows) > limit else None)
+
+    def get_image(self, verdict_id: int) -> bytes | None:
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT image FROM verdicts WHERE id = ?", (verdict_id,)).fetchone()
+        finally:
+            connection.close()
+        return row[0] if row is not None else None
+
+    def get_clip(self, verdict_id: int) -> str | None:
+        """Path of the verdict's clip, which may not be written yet."""
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT clip FROM verdicts WHERE id = ?", (verdict_id,)).fetchone()
+        finally:
+            connection.close()
+        return os.path.join(self.clip_dir, row[0]) if row is not None and row[0] is not None else None
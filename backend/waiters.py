@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class Waiter:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    async def wait(self, timeout: float | None = None) -> bool:
+        """Until notified, False if the timeout runs out first."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.event.clear()
+        return True
+
+
+class Waiters:
+    """
+    Tasks on any event loop waiting for something that plain threads change.
+    A thread calls notify() after the change, which wakes every registered
+    waiter on its own loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: set[Waiter] = set()
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+    @contextmanager
+    def waiter(self) -> Iterator[Waiter]:
+        waiter = Waiter()
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            yield waiter
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def notify(self):
+        with self._lock:
+            waiters = list(self._waiters)
+
+        for waiter in waiters:
+            try:
+                waiter.loop.call_soon_threadsafe(waiter.event.set)
+            except RuntimeError:
+                # Event loop already closed
+                pass
@@ -1,9 +1,9 @@
 "use client"
 
 import ProductBoard from "@/components/ProductBoard";
-import {useEffect, useState} from "react";
+import {useEffect, useRef, useState} from "react";
 
-type DecisionAnswer = {
+export type DecisionAnswer = {
     description: string
     higher_level_reasoning: string
     escalation_level: string
@@ -29,21 +29,46 @@ type Props = {
     onAlarm: ()=>void
 }
 
+// Verdicts arrive as binary frames: 4 byte big-endian header length, JSON header, raw JPEG
+export const parseVerdictMessage = (buffer: ArrayBuffer): { decision: DecisionAnswer, image: string } => {
+    const headerLength = new DataView(buffer).getUint32(0);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+    const image = URL.createObjectURL(new Blob([new Uint8Array(buffer, 4 + headerLength)], { type: 'image/jpeg' }));
+    return { decision: header.decision, image: image };
+}
+
+// Crops are blob URLs, which live until revoked: let go of the ones no longer shown, and all of them on unmount
+export const useRevokeEvicted = (images: string[]) => {
+    const live = useRef<Set<string>>(new Set());
+
+    useEffect(() => {
+        const shown = new Set(images);
+        live.current.forEach(image => {
+            if (!shown.has(image)) URL.revokeObjectURL(image);
+        });
+        live.current = shown;
+    }, [images]);
+
+    useEffect(() => () => live.current.forEach(image => URL.revokeObjectURL(image)), []);
+}
+
 export const FeedHolder = ({onAlarm}: Props) => {
     const [discardCards, setDiscardCards] = useState<FeedMessage[]>([]);
     const [logCards, setLogCards] = useState<FeedMessage[]>([]);
     const [threatCards, setThreatCards] = useState<FeedMessage[]>([]);
+    useRevokeEvicted([...discardCards, ...logCards, ...threatCards].map(card => card.image));
 
     useEffect(() => {
         const ws = new WebSocket("ws://localhost:8000/ws/verdicts");
+        ws.binaryType = "arraybuffer";
 
         ws.onmessage = (event) => {
 
-            const rawData = JSON.parse(event.data);
+            const message = parseVerdictMessage(event.data);
             const data: FeedMessage = {
                 id: Date.now(),
-                image: rawData.image,
-                decision: JSON.parse(rawData.decision),
+                image: message.image,
+                decision: message.decision,
                 date: new Date().toLocaleTimeString('en-US', { hour12: false })
             };
             // data.decision.escalation_level = ESCALATION_LEVELS[data.decision.escalation_level as keyof typeof ESCALATION_LEVELS]
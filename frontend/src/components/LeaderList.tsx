@@ -4,6 +4,7 @@ export type Leader = {
     id: string,
     score: number,
     image: string,
+    thumbnail: string,
     name: string,
 };
 
@@ -47,7 +48,7 @@ const LeaderList = ({ items, handleNameChange }: Props) => {
                 <p>{index+1}</p>
                 {/* eslint-disable-next-line @next/next/no-img-element */}
                 <img
-                src={item.image}
+                src={`http://localhost:8000${item.thumbnail}`}
                 alt={`${item.name}'s avatar`}
                 className="w-60 h-60 rounded-sm object-contain" // Ensure full image fits
                 />
@@ -2,6 +2,7 @@
 
 import React, { useEffect, useState } from "react";
 import { motion, AnimatePresence } from "framer-motion";
+import { parseVerdictMessage, useRevokeEvicted } from "@/components/FeedHolder";
 
 type DecisionAnswer = {
     description: string
@@ -27,15 +28,17 @@ const RollercoasterFeed = () => {
     const [leftColumn, setLeftColumn] = useState<FeedMessage[]>([]);
     const [rightColumn, setRightColumn] = useState<FeedMessage[]>([]);
     const [leftNext, setLeftNext] = useState(true);
+    useRevokeEvicted([...leftColumn, ...rightColumn].map(detection => detection.image));
 
     useEffect(() => {
         const ws = new WebSocket("ws://localhost:8000/ws/verdicts");
+        ws.binaryType = "arraybuffer";
 
         ws.onmessage = (event) => {
-            const rawData = JSON.parse(event.data);
+            const message = parseVerdictMessage(event.data);
             const data: FeedMessage = {
-                image: rawData.image,
-                decision: JSON.parse(rawData.decision),
+                image: message.image,
+                decision: message.decision,
                 date: new Date().toLocaleTimeString('en-US', { hour12: false })
             };
 
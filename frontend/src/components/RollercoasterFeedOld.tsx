@@ -1,6 +1,7 @@
 "use client"
 
 import React, {useEffect, useState} from "react";
+import {parseVerdictMessage, useRevokeEvicted} from "@/components/FeedHolder";
 
 type DecisionAnswer = {
     description: string
@@ -27,15 +28,17 @@ const ESCALATION_LEVELS = {
 const RollercoasterFeed = () => {
     const [detections, setDetections] = useState<(FeedMessage | null)[]>(Array(MAX_DETECTIONS).fill(null));
     const [nextIdx, setNextIdx] = useState(0);
+    useRevokeEvicted(detections.flatMap(detection => detection ? [detection.image] : []));
 
     useEffect(() => {
         const ws = new WebSocket("ws://localhost:8000/ws/verdicts");
+        ws.binaryType = "arraybuffer";
 
         ws.onmessage = (event) => {
-            const rawData = JSON.parse(event.data);
+            const message = parseVerdictMessage(event.data);
             const data: FeedMessage = {
-                image: rawData.image,
-                decision: JSON.parse(rawData.decision),
+                image: message.image,
+                decision: message.decision,
                 date: new Date().toLocaleTimeString('en-US', { hour12: false })
             };
 